@@ -1,47 +1,266 @@
-from flask import Flask, jsonify, request, send_file
-from controllers.controller import find_stars, fetch_image_urls, download_image_from_url, start_audio_creation, cancel_audio_processing, IMAGE_URLS, DEFAULT_OUTPUT_FILENAME
+import os
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
+from controllers.config import BATCH_MAX_ITEMS, SERVERLESS, STAR_QUERY_DEFAULT_LIMIT, STAR_QUERY_MAX_LIMIT
+from controllers.metrics import render_metrics
+
+# controllers.controller (y con él numpy, cv2, PIL y requests) se importa dentro de cada ruta:
+# en modo serverless el arranque en frío solo paga Flask, y cada ruta carga lo que necesita
 
 app = Flask(__name__)
 
+if not SERVERLESS:
+    from controllers.controller import preload_samples, start_image_prefetch
+
+    # Decodificar (o mapear desde el caché en disco) las notas de piano una sola vez al iniciar
+    preload_samples()
+    # Descargar el catálogo en segundo plano para que create-audio no espere a la red
+    start_image_prefetch()
+
 # Ruta para procesar las imágenes de la web
 @app.route('/api/process-image', methods=['GET'])
 def process_image():
+    from controllers.controller import cached_star_counts, fetch_image_urls, IMAGE_URLS
+
     # Llamar a la función que obtiene todas las imágenes .png
     fetch_image_urls()
     if IMAGE_URLS:
         response = {
             'status': 'success',
-            'images': {i: url for i, url in enumerate(IMAGE_URLS)}  # Asignar índice a cada imagen
+            'images': {i: url for i, url in enumerate(IMAGE_URLS)},  # Asignar índice a cada imagen
+            'stars': cached_star_counts()  # Estrellas ya detectadas por imagen (None si no hay caché)
         }
         return jsonify(response)
     return jsonify({'status': 'error', 'message': 'No se encontraron imágenes'}), 404
 
+# Ruta para consultar las estrellas de una región de la imagen (para dibujarlas sobre la vista actual)
+@app.route('/api/stars/<int:index>', methods=['GET'])
+def stars_in_region(index):
+    from controllers.controller import query_stars, IMAGE_URLS
+    from controllers.image_decode import ImageTooLargeError
+    from controllers.star_index import encode_stars_binary, BINARY_MIMETYPE
+
+    if not 0 <= index < len(IMAGE_URLS):
+        return jsonify({'status': 'error', 'message': 'Índice inválido'}), 400
+    args = request.args
+    region = tuple(args.get(name, type=int) for name in ('x0', 'y0', 'x1', 'y1'))
+    region = (region[0] or 0, region[1] or 0, region[2], region[3])  # Sin límites: toda la imagen
+    filters = {'min_area': args.get('minArea', type=int), 'max_area': args.get('maxArea', type=int),
+               'min_mag': args.get('minMag', type=float), 'max_mag': args.get('maxMag', type=float)}
+    offset = args.get('offset', 0, type=int)
+    limit = args.get('limit', STAR_QUERY_DEFAULT_LIMIT, type=int)
+    if offset < 0 or not 0 < limit <= STAR_QUERY_MAX_LIMIT:
+        return jsonify({'status': 'error', 'message': f'offset debe ser >= 0 y limit entre 1 y {STAR_QUERY_MAX_LIMIT}'}), 400
+    output = args.get('format', 'json')
+    if output not in ('json', 'binary'):
+        return jsonify({'status': 'error', 'message': f'Formato desconocido: {output}'}), 400
+
+    try:
+        result = query_stars(IMAGE_URLS[index], region, filters, offset, limit)
+    except ImageTooLargeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 413
+    if result is None:
+        return jsonify({'status': 'error', 'message': 'No se pudo descargar la imagen'}), 502
+    catalog, columns, total = result
+    count = len(columns['x'])
+    next_offset = offset + count if offset + count < total else None
+
+    if output == 'binary':
+        # Columnas empaquetadas (ver controllers/star_index.py); la paginación va también en cabeceras
+        headers = {'X-Total-Count': str(total)}
+        if next_offset is not None:
+            headers['X-Next-Offset'] = str(next_offset)
+        body = encode_stars_binary(columns, total, offset, catalog.width, catalog.height)
+        return Response(body, mimetype=BINARY_MIMETYPE, headers=headers)
+
+    # JSON por columnas: mucho más compacto que una lista de diccionarios
+    magnitudes = [round(float(m), 3) if m != float('inf') else None for m in columns['mag']]
+    return jsonify({
+        'status': 'success',
+        'width': catalog.width,
+        'height': catalog.height,
+        'total': total,
+        'offset': offset,
+        'count': count,
+        'next_offset': next_offset,
+        'stars': {'x': columns['x'].tolist(), 'y': columns['y'].tolist(), 'area': columns['area'].tolist(),
+                  'flux': [round(float(f), 2) for f in columns['flux']], 'mag': magnitudes},
+    })
+
 # Ruta para crear audio desde la imagen seleccionada
 @app.route('/api/create-audio', methods=['POST'])
 def create_audio():
+    from controllers.controller import submit_audio_job, IMAGE_URLS, INSTRUMENTS, DEFAULT_INSTRUMENT
+    from controllers.encoders import AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT, format_available
+    from controllers.jobs import QueueFullError
+
     data = request.json
     index = data.get('index')
 
     if index is not None and 0 <= index < len(IMAGE_URLS):
-        image_url = IMAGE_URLS[index]
-        image = download_image_from_url(image_url)
-        
-        if image:
-            coords, _ = find_stars(image)
-            max_stars = data.get('maxStars')
-            interval = data.get('interval', 350)
-
-            # Llamar la lógica para crear el audio a partir de las coordenadas
-            start_audio_creation(coords, image.width, DEFAULT_OUTPUT_FILENAME, max_stars, interval, lambda p: None, lambda s: None)
-            return jsonify({'status': 'success', 'message': f'Audio generado para la imagen {index}'})
-        else:
-            return jsonify({'status': 'error', 'message': 'No se pudo descargar la imagen'}), 400
+        max_stars = data.get('maxStars')
+        interval = data.get('interval', 350)
+        stream = bool(data.get('stream', False))
+        profile = bool(data.get('profile', False))  # Incluir el desglose de tiempos por etapa en el trabajo
+        audio_format = data.get('format', DEFAULT_AUDIO_FORMAT)
+        if not format_available(audio_format):
+            return jsonify({'status': 'error', 'message': f'Formato no disponible: {audio_format}',
+                            'formats': [name for name in AUDIO_FORMATS if format_available(name)]}), 400
+        instrument = data.get('instrument', DEFAULT_INSTRUMENT)
+        if instrument not in INSTRUMENTS:
+            return jsonify({'status': 'error', 'message': f'Instrumento desconocido: {instrument}',
+                            'instruments': list(INSTRUMENTS)}), 400
+        velocity = bool(data.get('velocity', False))  # Intensidad de cada nota según el brillo de la estrella
+        pan = bool(data.get('pan', False))  # Panorama estéreo según la posición x de la estrella
+
+        # Encolar la descarga, detección y mezcla; el cliente consulta el estado con el id del trabajo
+        try:
+            job = submit_audio_job(index, max_stars, interval, stream, audio_format, profile, instrument, velocity, pan)
+        except QueueFullError:
+            response = jsonify({'status': 'error', 'message': 'Servidor ocupado, intenta de nuevo más tarde'})
+            return response, 429, {'Retry-After': '5'}
+        response = {'status': 'success', 'job_id': job.id, 'message': f'Generando audio para la imagen {index}',
+                    'cached': job.cached}
+        if stream:
+            response['stream_url'] = f'/api/jobs/{job.id}/stream'
+        if profile:
+            # Parcial mientras el trabajo no termina; el desglose completo está en /api/jobs/<id>
+            response['profile'] = job.profile
+        # 200 si el audio ya estaba en caché y se puede descargar de inmediato
+        return jsonify(response), 200 if job.status == 'done' else 202
     return jsonify({'status': 'error', 'message': 'Índice inválido'}), 400
 
-# Ruta para descargar el audio generado
+# Ruta para consultar el estado y el progreso de un trabajo
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    from controllers.controller import get_job_manager
+
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Trabajo no encontrado'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+# Ruta para cancelar un trabajo sin afectar a los demás
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    from controllers.controller import get_job_manager
+
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Trabajo no encontrado'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+def _job_mimetype(job):
+    from controllers.encoders import AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT
+
+    return AUDIO_FORMATS[job.params.get('format', DEFAULT_AUDIO_FORMAT)]['mimetype']
+
+# Ruta para escuchar el audio (WAV) mientras se genera; con el trabajo terminado admite peticiones Range
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    from controllers.controller import get_job_manager
+
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Trabajo no encontrado'}), 404
+    if job.stream is None:
+        # Trabajo servido desde el caché de resultados (o sin stream): enviar el archivo terminado
+        if job.status == 'done':
+            return send_file(job.output_path, mimetype=_job_mimetype(job), conditional=True)
+        return jsonify({'status': 'error', 'message': 'Trabajo sin stream'}), 404
+    if job.stream.complete and os.path.isfile(job.stream.path):
+        return send_file(job.stream.path, mimetype='audio/wav', conditional=True)
+    # Esperar a que el trabajo salga de la cola: si se cancela o falla antes de mezclar, responder con el error
+    if not job.stream.wait_started():
+        return jsonify({'status': 'error', 'message': f'El audio no se generó ({job.status})', 'job': job.to_dict()}), 409
+    # Sin Content-Length: Flask envía la respuesta con Transfer-Encoding: chunked
+    return Response(stream_with_context(job.stream.iter_bytes()), mimetype='audio/wav')
+
+# Ruta para descargar el audio generado por un trabajo
 @app.route('/api/download-audio', methods=['GET'])
 def download_audio():
-    return send_file(DEFAULT_OUTPUT_FILENAME, as_attachment=True)
+    from controllers.controller import get_job_manager
+
+    job_id = request.args.get('job')
+    if not job_id:
+        return jsonify({'status': 'error', 'message': 'Falta el parámetro job'}), 400
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Trabajo no encontrado'}), 404
+    if job.status != 'done':
+        return jsonify({'status': 'error', 'message': f'El audio no está listo ({job.status})', 'job': job.to_dict()}), 409
+    return send_file(job.output_path, mimetype=_job_mimetype(job), as_attachment=True, conditional=True)
+
+def _batch_specs(data):
+    """
+    Normaliza los elementos del lote; los inválidos llevan 'error' y fallan sin detener el resto.
+    """
+    from controllers.controller import IMAGE_URLS, INSTRUMENTS, DEFAULT_INSTRUMENT
+    from controllers.encoders import DEFAULT_AUDIO_FORMAT, format_available
+
+    defaults = data.get('defaults') or {}
+    items = data.get('items')
+    if items == 'all':
+        items = [{'index': i} for i in range(len(IMAGE_URLS))]  # Todo el catálogo con los mismos parámetros
+    if not isinstance(items, list):
+        return None
+    specs = []
+    for item in items:
+        item = {**defaults, **item} if isinstance(item, dict) else {**defaults, 'index': item}
+        spec = {
+            'index': item.get('index'),
+            'maxStars': item.get('maxStars'),
+            'interval': item.get('interval', 350),
+            'format': item.get('format', DEFAULT_AUDIO_FORMAT),
+            'instrument': item.get('instrument', DEFAULT_INSTRUMENT),
+            'velocity': bool(item.get('velocity', False)),
+            'pan': bool(item.get('pan', False)),
+        }
+        if not isinstance(spec['index'], int) or not 0 <= spec['index'] < len(IMAGE_URLS):
+            spec['error'] = 'Índice inválido'
+        elif not format_available(spec['format']):
+            spec['error'] = f"Formato no disponible: {spec['format']}"
+        elif spec['instrument'] not in INSTRUMENTS:
+            spec['error'] = f"Instrumento desconocido: {spec['instrument']}"
+        specs.append(spec)
+    return specs
+
+# Ruta para renderizar muchas imágenes (o barridos de parámetros) en una sola llamada
+@app.route('/api/batch-audio', methods=['POST'])
+def batch_audio():
+    from controllers.controller import submit_batch
+
+    specs = _batch_specs(request.json or {})
+    if not specs:
+        return jsonify({'status': 'error', 'message': 'Se requiere una lista de elementos'}), 400
+    if len(specs) > BATCH_MAX_ITEMS:
+        return jsonify({'status': 'error', 'message': f'Máximo {BATCH_MAX_ITEMS} elementos por lote'}), 400
+    batch = submit_batch(specs)
+    return jsonify({'status': 'success', 'batch_id': batch.id, 'manifest_url': f'/api/batches/{batch.id}'}), 202
+
+# Ruta para consultar el manifiesto de un lote: estado, descarga y tiempos de cada elemento
+@app.route('/api/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    from controllers.controller import get_batch_manager
+
+    batch = get_batch_manager().get(batch_id)
+    if batch is None:
+        return jsonify({'status': 'error', 'message': 'Lote no encontrado'}), 404
+    return jsonify({'status': 'success', 'batch': batch.to_dict()})
+
+# Ruta para cancelar los elementos pendientes de un lote
+@app.route('/api/batches/<batch_id>/cancel', methods=['POST'])
+def cancel_batch(batch_id):
+    from controllers.controller import get_batch_manager
+
+    batch = get_batch_manager().cancel(batch_id)
+    if batch is None:
+        return jsonify({'status': 'error', 'message': 'Lote no encontrado'}), 404
+    return jsonify({'status': 'success', 'batch': batch.to_dict()})
+
+# Métricas en formato de texto de Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,98 @@
+"""
+Compara la detección original, la vectorizada y la de mosaicos sobre un campo estelar sintético.
+
+Además comprueba que los mosaicos den exactamente lo mismo que la ruta directa en campos con discos y
+anillos más grandes que el solapamiento, los que obligan a resolver las costuras; si alguno difiere el
+proceso termina con código 1.
+
+Uso: python -m benchmarks.bench_detection --width 8000 --height 8000 --workers 4
+"""
+import sys
+import argparse
+import time
+import numpy as np
+import cv2
+
+from benchmarks.starfield import generate_starfield, legacy_find_stars
+from controllers.detection import detect_stars, detect_stars_tiled
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def large_object_field(width, height, seed, count=10):
+    """
+    Campo estelar con discos y anillos de 20 a 300 píxeles de radio.
+    """
+    field = generate_starfield(width, height, 0.002, seed=seed)
+    rng = np.random.default_rng(seed + 100)
+    for _ in range(count):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        thickness = -1 if rng.random() < 0.5 else int(rng.integers(2, 8))
+        cv2.circle(field, center, int(rng.integers(20, 300)), 230, thickness)
+    return field
+
+
+def check_large_objects(seeds, workers):
+    """
+    Devuelve los casos (semilla, mosaico, solapamiento) en los que detect_stars_tiled difiere de detect_stars.
+    """
+    failures = []
+    for seed in range(seeds):
+        gray_image = large_object_field(1400, 1100, seed)
+        expected = detect_stars(gray_image)
+        for tile_size, overlap in ((128, 8), (256, 16), (512, 64)):
+            tiled = detect_stars_tiled(gray_image, tile_size=tile_size, overlap=overlap, workers=workers)
+            if not np.array_equal(expected, tiled):
+                failures.append((seed, tile_size, overlap))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=8000)
+    parser.add_argument("--height", type=int, default=8000)
+    parser.add_argument("--density", type=float, default=0.005)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tile-size", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--check-seeds", type=int, default=10, help="Campos con objetos grandes a comprobar")
+    args = parser.parse_args()
+
+    gray_image = generate_starfield(args.width, args.height, args.density)
+    print(f"Imagen sintética {args.width}x{args.height} ({gray_image.size / 1e6:.1f} MP)")
+
+    legacy_time, legacy = best_time(lambda: legacy_find_stars(gray_image), args.repeat)
+    single_time, single = best_time(lambda: detect_stars(gray_image), args.repeat)
+    # La primera llamada arranca el pool de procesos; no se cuenta
+    detect_stars_tiled(gray_image, tile_size=args.tile_size, workers=args.workers)
+    tiled_time, tiled = best_time(
+        lambda: detect_stars_tiled(gray_image, tile_size=args.tile_size, workers=args.workers), args.repeat)
+
+    print(f"{'método':<28}{'estrellas':>10}{'segundos':>10}{'aceleración':>13}")
+    for name, seconds, count in (
+        ("find_stars original", legacy_time, len(legacy)),
+        ("detect_stars", single_time, len(single)),
+        (f"detect_stars_tiled ({args.workers}w)", tiled_time, len(tiled)),
+    ):
+        print(f"{name:<28}{count:>10}{seconds:>10.3f}{legacy_time / seconds:>12.1f}x")
+    identical = np.array_equal(single, tiled)
+    print(f"Mosaicos idénticos a la ruta directa: {identical}")
+
+    failures = check_large_objects(args.check_seeds, args.workers)
+    print(f"Objetos más grandes que el solapamiento: {args.check_seeds * 3 - len(failures)}/{args.check_seeds * 3} "
+          f"campos idénticos")
+    for seed, tile_size, overlap in failures:
+        print(f"DIFERENTE semilla={seed} mosaico={tile_size} solapamiento={overlap}", file=sys.stderr)
+    sys.exit(0 if identical and not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
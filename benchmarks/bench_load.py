@@ -0,0 +1,436 @@
+"""
+Prueba de carga de extremo a extremo del servidor, sin conexión a internet.
+
+Levanta un servidor HTTP local que reemplaza a stsci-opo.org y webbtelescope.org (mismas rutas del
+catálogo, con campos estelares sintéticos o las fotos de resources/photos con --photos), arranca app.py
+en otro proceso apuntando a él con POLARIS_IMAGE_MIRROR y lanza clientes concurrentes que repiten el
+flujo completo: /api/process-image -> /api/create-audio -> /api/jobs/<id> -> /api/download-audio.
+Para cada nivel de concurrencia reporta el rendimiento, las latencias p50/p95/p99 de cada paso y la
+tasa de errores.
+
+También comprueba que el audio sea correcto bajo carga: cada trabajo debe conservar los parámetros
+pedidos, todas las descargas de los mismos parámetros deben ser idénticas y un mismo audio no puede
+aparecer para parámetros distintos (p. ej. un cliente que descarga el audio de otro). Si hay algún
+problema de ese tipo, o la tasa de errores supera --max-error-rate, el proceso termina con código 1.
+
+Uso: python -m benchmarks.bench_load --concurrency 1,4,16 --flows 5 --output carga.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import wave
+import random
+import socket
+import hashlib
+import argparse
+import platform
+import threading
+import subprocess
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import numpy as np
+import requests
+from PIL import Image
+
+from benchmarks.bench_pipeline import PHOTOS_FOLDER
+from benchmarks.starfield import generate_starfield
+from controllers.config import BASE_DIR
+
+DEFAULT_CONCURRENCY = "1,4,16"
+DEFAULT_MAX_STARS = "50,100,200"
+DEFAULT_INTERVALS = "100,200,350"
+POLL_INTERVAL = 0.05  # Segundos entre consultas del estado de un trabajo
+SERVER_START_TIMEOUT = 120
+STEPS = ("process_image", "create_audio", "render", "download", "flow")
+PERCENTILES = (50, 95, 99)
+
+# Se ejecuta en el proceso del servidor; Flask atiende cada petición en su propio hilo
+SERVER_SCRIPT = """
+import sys
+from app import app
+app.run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)
+"""
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Conexiones persistentes, como la sesión con pool de image_cache
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+        image = server.images.get(self.path)
+        if image is None:
+            self.send_error(404)
+            return
+        if server.delay:
+            time.sleep(server.delay)
+        body, content_type, etag = image
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_image_server(images, port=0, delay=0.0):
+    """
+    Sirve images ({ruta con consulta: (bytes, tipo, etag)}) en un hilo y devuelve el servidor.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), ImageRequestHandler)
+    server.daemon_threads = True
+    server.images = images
+    server.delay = delay
+    server.hits = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="image-server", daemon=True).start()
+    return server
+
+
+def catalog_images(urls, photos=False, size=(2000, 1500)):
+    """
+    Una imagen por URL del catálogo, indexada por su ruta; devuelve (imágenes, origen de cada índice).
+
+    El origen identifica el contenido: dos índices con el mismo origen (fotos repetidas cuando hay más
+    URLs que fotos) generan el mismo audio y no cuentan como un cruce entre clientes.
+    """
+    names = sorted(os.listdir(PHOTOS_FOLDER)) if photos else []
+    images = {}
+    sources = []
+    for i, url in enumerate(urls):
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        if photos:
+            name = names[i % len(names)]
+            with open(os.path.join(PHOTOS_FOLDER, name), "rb") as f:
+                body = f.read()
+            content_type = "image/png" if name.lower().endswith(".png") else "image/jpeg"
+            sources.append(name)
+        else:
+            field = generate_starfield(*size, seed=i)
+            buffer = io.BytesIO()
+            image_format = "PNG" if parts.path.lower().endswith(".png") else "JPEG"
+            Image.fromarray(np.repeat(field[:, :, None], 3, axis=2)).save(buffer, image_format)
+            body = buffer.getvalue()
+            content_type = f"image/{image_format.lower()}"
+            sources.append(f"campo-{i}")
+        images[path] = (body, content_type, f'"{hashlib.sha256(body).hexdigest()[:16]}"')
+    return images, sources
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app_server(mirror, cache_folder, log_file):
+    """
+    Arranca app.py en un proceso aparte y espera a que responda; devuelve (proceso, URL base).
+    """
+    port = free_port()
+    env = dict(os.environ, POLARIS_IMAGE_MIRROR=mirror, POLARIS_CACHE_DIR=cache_folder,
+               POLARIS_LOG_LEVEL="WARNING")
+    process = subprocess.Popen([sys.executable, "-c", SERVER_SCRIPT, str(port)], cwd=BASE_DIR, env=env,
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {process.returncode})")
+        try:
+            requests.get(f"{base_url}/metrics", timeout=1)
+            return process, base_url
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+class FlowError(Exception):
+    def __init__(self, step, message):
+        super().__init__(f"{step}: {message}")
+        self.step = step
+
+
+def run_flow(session, base_url, spec, timeout):
+    """
+    Un flujo completo de un cliente; devuelve los tiempos de cada paso y el audio descargado.
+    """
+    timings = {}
+    busy = 0
+    flow_start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+
+    def call(step, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, f"{base_url}{path}", timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            raise FlowError(step, type(e).__name__)
+        timings[step] = timings.get(step, 0) + time.perf_counter() - start
+        return response
+
+    response = call("process_image", "GET", "/api/process-image")
+    if response.status_code != 200:
+        raise FlowError("process_image", f"HTTP {response.status_code}")
+
+    while True:
+        response = call("create_audio", "POST", "/api/create-audio", json=spec)
+        if response.status_code != 429:
+            break
+        # Cola llena: reintentar como haría el cliente web, sin contarlo como error
+        busy += 1
+        if time.monotonic() > deadline:
+            raise FlowError("create_audio", "HTTP 429")
+        time.sleep(min(float(response.headers.get("Retry-After", 1)), 1))
+    if response.status_code not in (200, 202):
+        raise FlowError("create_audio", f"HTTP {response.status_code}")
+    created = response.json()
+    job_id = created["job_id"]
+
+    render_start = time.perf_counter()
+    while True:
+        response = call("poll", "GET", f"/api/jobs/{job_id}")
+        if response.status_code != 200:
+            raise FlowError("render", f"HTTP {response.status_code}")
+        job = response.json()["job"]
+        if job["status"] not in ("queued", "running"):
+            break
+        if time.monotonic() > deadline:
+            raise FlowError("render", "tiempo agotado")
+        time.sleep(POLL_INTERVAL)
+    timings["render"] = time.perf_counter() - render_start
+    if job["status"] != "done":
+        raise FlowError("render", job["status"])
+
+    response = call("download", "GET", "/api/download-audio", params={"job": job_id})
+    if response.status_code != 200:
+        raise FlowError("download", f"HTTP {response.status_code}")
+    timings["flow"] = time.perf_counter() - flow_start
+    return {'timings': timings, 'busy': busy, 'cached': created.get("cached", False), 'job': job,
+            'content_type': response.headers.get("Content-Type", ""), 'audio': response.content}
+
+
+def check_audio(spec, result):
+    """
+    Problemas del audio de un solo flujo: parámetros del trabajo distintos a los pedidos o archivo inválido.
+    """
+    problems = []
+    params = result['job']['params']
+    for key, value in spec.items():
+        if params.get(key) != value:
+            problems.append(f"el trabajo tiene {key}={params.get(key)!r} en lugar de {value!r}")
+    if spec.get("format") == "wav":
+        try:
+            with wave.open(io.BytesIO(result['audio'])) as audio:
+                if audio.getnframes() == 0:
+                    problems.append("WAV sin frames")
+        except (wave.Error, EOFError) as e:
+            problems.append(f"WAV inválido: {e}")
+    return problems
+
+
+def run_level(base_url, concurrency, flows, specs, timeout, seed):
+    """
+    concurrency clientes, cada uno con su sesión, repiten flows flujos con parámetros al azar.
+    """
+    records = []
+    lock = threading.Lock()
+
+    def client(number):
+        rng = random.Random(seed * 1000 + number)
+        with requests.Session() as session:
+            for _ in range(flows):
+                spec = rng.choice(specs)
+                record = {'spec': spec}
+                try:
+                    result = run_flow(session, base_url, spec, timeout)
+                    record.update(timings=result['timings'], busy=result['busy'], cached=result['cached'],
+                                  digest=hashlib.sha256(result['audio']).hexdigest(),
+                                  problems=check_audio(spec, result))
+                except FlowError as e:
+                    record.update(error=str(e), step=e.step)
+                with lock:
+                    records.append(record)
+
+    threads = [threading.Thread(target=client, args=(number,), name=f"client-{number}")
+               for number in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start
+
+
+def summarize(concurrency, records, elapsed):
+    ok = [record for record in records if 'error' not in record]
+    errors = {}
+    for record in records:
+        if 'error' in record:
+            errors[record['error']] = errors.get(record['error'], 0) + 1
+    latency = {}
+    for step in STEPS:
+        values = [record['timings'][step] for record in ok if step in record['timings']]
+        if values:
+            latency[step] = {f"p{p}": round(float(np.percentile(values, p)), 6) for p in PERCENTILES}
+    return {
+        'stage': 'load',
+        'step': f"c{concurrency}",
+        'concurrency': concurrency,
+        'flows': len(records),
+        'ok': len(ok),
+        'errors': errors,
+        'error_rate': round(1 - len(ok) / len(records), 4) if records else 0,
+        'throughput': round(len(ok) / elapsed, 3),
+        'busy_retries': sum(record.get('busy', 0) for record in records),
+        'cached': sum(1 for record in ok if record['cached']),
+        'seconds': round(elapsed, 3),
+        'latency': latency,
+    }
+
+
+def check_consistency(records, sources, star_counts):
+    """
+    Problemas entre flujos: descargas distintas para los mismos parámetros o el mismo audio para otros.
+
+    maxStars mayor que las estrellas de la imagen da el mismo audio, así que se compara el valor efectivo.
+    """
+    problems = []
+    digests = {}
+    owners = {}
+    for record in records:
+        if 'digest' not in record:
+            continue
+        spec = record['spec']
+        problems.extend(f"{spec}: {problem}" for problem in record['problems'])
+        count = star_counts.get(str(spec['index']))
+        effective = min(spec['maxStars'], count) if count is not None else spec['maxStars']
+        key = (sources[spec['index']], effective, spec['interval'], spec['format'], spec.get('instrument'))
+        digests.setdefault(key, set()).add(record['digest'])
+        owners.setdefault(record['digest'], set()).add(key)
+    for key, found in digests.items():
+        if len(found) > 1:
+            problems.append(f"{len(found)} audios distintos para {key}")
+    for digest, keys in owners.items():
+        if len(keys) > 1:
+            problems.append(f"el mismo audio ({digest[:12]}) para {sorted(keys, key=str)}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default=DEFAULT_CONCURRENCY, help="Niveles de clientes simultáneos")
+    parser.add_argument("--flows", type=int, default=5, help="Flujos por cliente en cada nivel")
+    parser.add_argument("--max-stars", default=DEFAULT_MAX_STARS, help="Valores de maxStars a sortear")
+    parser.add_argument("--intervals", default=DEFAULT_INTERVALS, help="Intervalos (ms) a sortear")
+    parser.add_argument("--images", type=int, help="Pedir audio solo de las primeras N imágenes")
+    parser.add_argument("--format", default="wav")
+    parser.add_argument("--instrument", help="Instrumento (por defecto el del servidor)")
+    parser.add_argument("--photos", action="store_true", help="Servir las fotos de resources/photos")
+    parser.add_argument("--image-size", default="2000x1500", help="Ancho x alto de los campos sintéticos")
+    parser.add_argument("--image-delay", type=float, default=0.0, help="Demora (s) de cada respuesta de imagen")
+    parser.add_argument("--image-port", type=int, default=0, help="Puerto del servidor de imágenes")
+    parser.add_argument("--url", help="Servidor ya en marcha (con POLARIS_IMAGE_MIRROR apuntando a --image-port)")
+    parser.add_argument("--timeout", type=float, default=120, help="Segundos máximos por flujo")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto la salida estándar)")
+    args = parser.parse_args()
+
+    from controllers.controller import IMAGE_URLS
+
+    # Se sirve todo el catálogo (el servidor lo descarga al arrancar) aunque se pidan menos imágenes
+    size = tuple(int(value) for value in args.image_size.lower().split("x"))
+    images, sources = catalog_images(IMAGE_URLS, args.photos, size)
+    image_count = min(args.images or len(IMAGE_URLS), len(IMAGE_URLS))
+    image_server = start_image_server(images, args.image_port, args.image_delay)
+    mirror = f"http://127.0.0.1:{image_server.server_port}"
+    print(f"Servidor de imágenes en {mirror} ({len(images)} imágenes)", file=sys.stderr)
+
+    specs = [{'index': index, 'maxStars': max_stars, 'interval': interval, 'format': args.format}
+             for index in range(image_count)
+             for max_stars in (int(value) for value in args.max_stars.split(","))
+             for interval in (int(value) for value in args.intervals.split(","))]
+    if args.instrument:
+        for spec in specs:
+            spec['instrument'] = args.instrument
+
+    results = []
+    records = []
+    with tempfile.TemporaryDirectory() as cache_folder:
+        log_path = os.path.join(cache_folder, "server.log")
+        with open(log_path, "w") as log_file:
+            process = None
+            try:
+                if args.url:
+                    base_url = args.url.rstrip("/")
+                else:
+                    process, base_url = start_app_server(mirror, cache_folder, log_file)
+                for level, concurrency in enumerate(int(value) for value in args.concurrency.split(",")):
+                    level_records, elapsed = run_level(base_url, concurrency, args.flows, specs, args.timeout,
+                                                       args.seed + level)
+                    records.extend(level_records)
+                    result = summarize(concurrency, level_records, elapsed)
+                    results.append(result)
+                    flow = result['latency'].get('flow', {})
+                    print(f"c={concurrency:<4}{result['throughput']:>8.2f} flujos/s  "
+                          f"p50 {flow.get('p50', float('nan')):.3f}s  p95 {flow.get('p95', float('nan')):.3f}s  "
+                          f"p99 {flow.get('p99', float('nan')):.3f}s  errores {result['error_rate']:.1%}",
+                          file=sys.stderr)
+                star_counts = requests.get(f"{base_url}/api/process-image", timeout=args.timeout).json()["stars"]
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait()
+                image_server.shutdown()
+        if process is not None and process.returncode not in (0, -15):
+            with open(log_path) as f:
+                sys.stderr.write(f.read()[-4000:])
+
+    problems = check_consistency(records, sources, star_counts)
+    failed = [result for result in results if result['error_rate'] > args.max_error_rate]
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'images': image_count,
+            'photos': args.photos,
+            'flows_per_client': args.flows,
+            'image_requests': image_server.hits,
+        },
+        'results': results,
+        'problems': problems,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for problem in problems:
+        print(f"AUDIO INCORRECTO: {problem}", file=sys.stderr)
+    for result in failed:
+        print(f"ERRORES c={result['concurrency']}: {result['error_rate']:.1%} > {args.max_error_rate:.1%} "
+              f"{result['errors']}", file=sys.stderr)
+    sys.exit(1 if problems or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
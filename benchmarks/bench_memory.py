@@ -0,0 +1,176 @@
+"""
+Mide el pico de memoria (RSS) de decodificar, detectar y renderizar imágenes grandes.
+
+Cada medición corre en un proceso nuevo y reporta cuánto creció el pico de RSS respecto al proceso ya
+inicializado (módulos importados y banco de notas cargado), para comparar la decodificación anterior
+(RGB completo + copia en NumPy + cv2 + detect_stars) con el camino del servidor (detect_image_file). Las imágenes son campos estelares sintéticos
+guardados como JPEG y PNG. Los máximos son las claves memory/* (en MB) de benchmarks/thresholds.json;
+si alguno se supera el proceso termina con código 1.
+
+Uso: python -m benchmarks.bench_memory --size 6000x4000 --output memoria.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_pipeline import THRESHOLDS_FILE
+from benchmarks.starfield import generate_starfield
+from controllers.config import BASE_DIR
+
+MODES = ("legacy_decode", "decode", "render")
+RENDER_MAX_STARS = 500
+RENDER_INTERVAL = 50
+
+
+def _proc_status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise KeyError(field)
+
+
+def reset_peak_rss():
+    """
+    Reinicia el pico de RSS del proceso y devuelve el RSS actual en MB.
+
+    En Linux ru_maxrss conserva el pico del proceso padre a través de exec, así que se usa VmHWM,
+    que se puede reiniciar escribiendo 5 en /proc/self/clear_refs.
+    """
+    if os.path.isfile("/proc/self/clear_refs"):
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _proc_status_mb("VmRSS")
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    if os.path.isfile("/proc/self/status"):
+        return _proc_status_mb("VmHWM")
+    # Sin /proc (macOS): ru_maxrss en bytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+
+
+def run_child(mode, path):
+    """
+    Se ejecuta en el proceso hijo: mide una sola etapa y devuelve el crecimiento del pico de RSS.
+    """
+    import logging
+    from benchmarks.tones import synthetic_sample_bank
+    from controllers.controller import create_audio_from_coordinates, detect_image_file
+    from controllers.detection import detect_stars, to_grayscale
+    from controllers.log import get_logger
+
+    get_logger("bench").parent.setLevel(logging.WARNING)
+    bank = synthetic_sample_bank() if mode == "render" else None
+    baseline = reset_peak_rss()
+
+    if mode == "legacy_decode":
+        gray_image = to_grayscale(Image.open(path))
+        stars = detect_stars(gray_image)
+        del gray_image
+    else:
+        # Mismo camino que get_star_catalog en el servidor
+        stars, width, _ = detect_image_file(path)
+    if mode == "render":
+        with tempfile.TemporaryDirectory() as output_folder:
+            create_audio_from_coordinates(stars, width, os.path.join(output_folder, "audio.wav"),
+                                          RENDER_MAX_STARS, RENDER_INTERVAL, lambda progress: None,
+                                          lambda success: None, lambda: False, audio_format="wav", bank=bank)
+    return {'baseline_mb': baseline, 'peak_mb': peak_rss_mb() - baseline, 'detected': len(stars)}
+
+
+def measure(mode, path, env):
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_memory", "--child", mode, path], cwd=BASE_DIR,
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def write_images(folder, width, height):
+    """
+    Guarda el mismo campo estelar en RGB como JPEG y como PNG.
+    """
+    field = generate_starfield(width, height)
+    image = Image.fromarray(np.repeat(field[:, :, None], 3, axis=2))
+    del field
+    paths = []
+    for extension, options in (("jpg", {'quality': 92}), ("png", {'compress_level': 1})):
+        path = os.path.join(folder, f"campo.{extension}")
+        image.save(path, **options)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="6000x4000", help="Ancho x alto de las imágenes sintéticas")
+    parser.add_argument("--max-pixels", type=int, help="POLARIS_DECODE_MAX_PIXELS para los procesos medidos")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto la salida estándar)")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument("--child", nargs=2, metavar=("MODO", "IMAGEN"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(*args.child)))
+        return
+
+    width, height = (int(value) for value in args.size.lower().split("x"))
+    # Detección por mosaicos en el mismo proceso, para que el pico de RSS incluya todo el trabajo
+    env = dict(os.environ, POLARIS_LOG_LEVEL="WARNING", POLARIS_DETECTION_WORKERS="1")
+    if args.max_pixels:
+        env["POLARIS_DECODE_MAX_PIXELS"] = str(args.max_pixels)
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for path in write_images(folder, width, height):
+            image_format = os.path.splitext(path)[1][1:]
+            for mode in MODES:
+                result = {'stage': 'memory', 'step': f"{mode}_{image_format}", **measure(mode, path, env)}
+                results.append(result)
+                print(f"{result['step']:<22}{result['peak_mb']:>10.1f} MB  ({result['detected']} estrellas)",
+                      file=sys.stderr)
+
+    thresholds = {}
+    if os.path.isfile(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    regressions = []
+    for result in results:
+        limit = thresholds.get(f"memory/{result['step']}")
+        if limit is not None and result['peak_mb'] > limit:
+            regressions.append({'name': f"memory/{result['step']}", 'peak_mb': result['peak_mb'], 'limit': limit})
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'size': [width, height],
+            'max_pixels': args.max_pixels,
+        },
+        'results': results,
+        'regressions': regressions,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for regression in regressions:
+        print(f"FUERA DE PRESUPUESTO {regression['name']}: {regression['peak_mb']:.1f} MB > {regression['limit']:.1f} MB",
+              file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
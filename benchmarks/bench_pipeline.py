@@ -0,0 +1,235 @@
+"""
+Mide por separado find_stars, create_audio_from_coordinates y la exportación, sin conexión a internet.
+
+Las imágenes son campos estelares sintéticos (o las fotos de resources/photos con --photos) y las notas
+son tonos sintéticos en lugar de resources/piano. El resultado se guarda en JSON y se compara con
+los umbrales de benchmarks/thresholds.json; si alguna etapa los supera, o si la mezcla incremental no
+coincide con mix_notes, el proceso termina con código 1.
+
+Uso: python -m benchmarks.bench_pipeline --stars 100,1000,10000,100000 --output resultados.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import numpy as np
+from PIL import Image
+
+from benchmarks.starfield import generate_starfield
+from benchmarks.tones import synthetic_sample_bank
+from controllers.config import BASE_DIR
+from controllers.controller import find_stars, create_audio_from_coordinates, map_to_scale
+from controllers.detection import STAR_DTYPE
+from controllers.encoders import AUDIO_FORMATS, encode_audio
+from controllers.log import get_logger
+from controllers.mixer import plan_mix, mix_notes
+from controllers.mix_checkpoints import MixCheckpoints, mix_incremental
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+PHOTOS_FOLDER = os.path.join(BASE_DIR, "resources", "photos")
+DEFAULT_STAR_COUNTS = "100,1000,10000,100000"
+STAR_DENSITY = 0.004  # Estrellas por píxel de los campos sintéticos
+MIN_THRESHOLD = 0.05  # Segundos; por debajo el ruido de medición domina
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_stars(count, width, height, seed=0):
+    """
+    Exactamente count estrellas en posiciones aleatorias, con el formato de detect_stars.
+    """
+    rng = np.random.default_rng(seed)
+    stars = np.zeros(count, dtype=STAR_DTYPE)
+    stars['x'] = np.sort(rng.integers(0, width, count))
+    stars['y'] = rng.integers(0, height, count)
+    stars['area'] = rng.integers(8, 40, count)
+    stars['flux'] = rng.uniform(1e3, 1e5, count)
+    return stars
+
+
+def bench_find_stars(star_count, repeat):
+    side = math.ceil(math.sqrt(star_count / STAR_DENSITY))
+    image = Image.fromarray(generate_starfield(side, side, STAR_DENSITY))
+    seconds, (coords, _) = best_time(lambda: find_stars(image), repeat)
+    return {'stage': 'find_stars', 'stars': star_count, 'seconds': seconds, 'detected': len(coords),
+            'image': f"{side}x{side}"}
+
+
+def bench_create_audio(star_count, bank, interval, output_folder, repeat):
+    side = math.ceil(math.sqrt(star_count / STAR_DENSITY))
+    stars = synthetic_stars(star_count, side, side)
+    output_filename = os.path.join(output_folder, f"bench-{star_count}.wav")
+    # Incluye la escritura WAV, que no lanza procesos externos; el resto de formatos se mide aparte
+    seconds, _ = best_time(lambda: create_audio_from_coordinates(
+        stars, side, output_filename, None, interval, lambda progress: None, lambda success: None,
+        should_cancel=lambda: False, audio_format="wav", bank=bank), repeat)
+    return {'stage': 'create_audio', 'stars': star_count, 'seconds': seconds,
+            'audio_seconds': os.path.getsize(output_filename) / (bank.sample_rate * bank.channels * 2)}
+
+
+def bench_exports(star_count, bank, interval, output_folder, formats, repeat):
+    side = math.ceil(math.sqrt(star_count / STAR_DENSITY))
+    stars = synthetic_stars(star_count, side, side)
+    y_values = stars['y']
+    note_numbers = map_to_scale(y_values, y_values.min(), y_values.max(), 25, 75).astype(int)
+    pcm = mix_notes(plan_mix(note_numbers, bank, interval), bank)
+
+    results = []
+    for audio_format in formats:
+        output_filename = os.path.join(output_folder, f"bench-{star_count}.{AUDIO_FORMATS[audio_format]['extension']}")
+        result = {'stage': f"export_{audio_format}", 'stars': star_count}
+        try:
+            result['seconds'], _ = best_time(
+                lambda: encode_audio(pcm, bank.sample_rate, bank.channels, output_filename, audio_format), repeat)
+            result['bytes'] = os.path.getsize(output_filename)
+        except Exception as e:
+            # MP3/Opus necesitan ffmpeg y FLAC el paquete soundfile; si faltan la etapa se omite
+            result['skipped'] = str(e) or type(e).__name__
+        results.append(result)
+    return results
+
+
+def bench_photos(repeat):
+    results = []
+    for name in sorted(os.listdir(PHOTOS_FOLDER)):
+        image = Image.open(os.path.join(PHOTOS_FOLDER, name))
+        image.load()
+        seconds, (coords, _) = best_time(lambda: find_stars(image), repeat)
+        results.append({'stage': 'find_stars_photo', 'photo': name, 'seconds': seconds, 'detected': len(coords),
+                        'image': f"{image.width}x{image.height}"})
+    return results
+
+
+def check_incremental_mix(bank, interval, steps=(500, 800, 1200, 300, 1000), seed=0):
+    """
+    Mezcla el mismo plan con distintos maxStars mediante mix_incremental y lo compara con mix_notes.
+
+    Con el intervalo pequeño las notas se solapan tanto que la suma se recorta, así que también se comprueba
+    que los puntos de control guardan la cola sin recortar. Devuelve los pasos que no coinciden.
+    """
+    notes = np.random.default_rng(seed).integers(25, 76, max(steps))
+    store = MixCheckpoints()
+    mismatches = []
+    for count in steps:
+        plan = plan_mix(notes[:count], bank, interval)
+        pcm, reused = mix_incremental(plan, bank, interval, store, "check")
+        if not np.array_equal(pcm, mix_notes(plan, bank)):
+            mismatches.append({'stars': count, 'reused': reused})
+    return mismatches
+
+
+def result_name(result):
+    detail = next(result[key] for key in ('stars', 'photo', 'step') if key in result)
+    return f"{result['stage']}/{detail}"
+
+
+def check_thresholds(results, thresholds):
+    """
+    Devuelve las etapas cuyo tiempo supera el máximo permitido.
+    """
+    regressions = []
+    for result in results:
+        limit = thresholds.get(result_name(result))
+        if limit is not None and 'seconds' in result and result['seconds'] > limit:
+            regressions.append({'name': result_name(result), 'seconds': result['seconds'], 'limit': limit})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", default=DEFAULT_STAR_COUNTS, help="Cantidades de estrellas separadas por comas")
+    parser.add_argument("--interval", type=int, default=5,
+                        help="Milisegundos entre notas (pequeño para que 100k estrellas quepan en memoria)")
+    parser.add_argument("--formats", default=",".join(AUDIO_FORMATS))
+    parser.add_argument("--photos", action="store_true", help="Medir también find_stars con resources/photos")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto la salida estándar)")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument("--write-thresholds", type=float, metavar="MARGEN",
+                        help="Reescribe los umbrales como tiempo medido x MARGEN en lugar de comprobarlos")
+    args = parser.parse_args()
+
+    star_counts = [int(count) for count in args.stars.split(",")]
+    formats = [audio_format for audio_format in args.formats.split(",") if audio_format]
+    bank = synthetic_sample_bank()
+    get_logger("bench").parent.setLevel(logging.WARNING)  # Sin mensajes por cada render medido
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        for star_count in star_counts:
+            results.append(bench_find_stars(star_count, args.repeat))
+            results.append(bench_create_audio(star_count, bank, args.interval, output_folder, args.repeat))
+            results.extend(bench_exports(star_count, bank, args.interval, output_folder, formats, args.repeat))
+            for result in results:
+                if result.get('stars') != star_count:
+                    continue
+                if 'seconds' in result:
+                    print(f"{result_name(result):<28}{result['seconds']:>10.3f}s", file=sys.stderr)
+                else:
+                    print(f"{result_name(result):<28}{'omitido':>11} ({result['skipped']})", file=sys.stderr)
+    if args.photos:
+        results.extend(bench_photos(args.repeat))
+    mix_mismatches = check_incremental_mix(bank, args.interval)
+
+    thresholds = {}
+    if os.path.isfile(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+
+    if args.write_thresholds:
+        # Solo se reemplazan las etapas medidas aquí; los presupuestos de arranque (startup/*) se conservan
+        thresholds.update({result_name(result): round(max(result['seconds'] * args.write_thresholds, MIN_THRESHOLD), 4)
+                           for result in results if 'seconds' in result})
+        with open(args.thresholds, "w") as f:
+            json.dump(thresholds, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Umbrales guardados en {args.thresholds}", file=sys.stderr)
+        regressions = []
+    else:
+        regressions = check_thresholds(results, thresholds)
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'interval': args.interval,
+            'repeat': args.repeat,
+        },
+        'results': results,
+        'regressions': regressions,
+        'mix_mismatches': mix_mismatches,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for regression in regressions:
+        print(f"REGRESIÓN {regression['name']}: {regression['seconds']:.3f}s > {regression['limit']:.3f}s",
+              file=sys.stderr)
+    for mismatch in mix_mismatches:
+        print(f"MEZCLA INCREMENTAL DISTINTA con {mismatch['stars']} estrellas "
+              f"({mismatch['reused']} notas reutilizadas)", file=sys.stderr)
+    sys.exit(1 if regressions or mix_mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
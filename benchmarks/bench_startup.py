@@ -0,0 +1,102 @@
+"""
+Mide el arranque en frío en modo serverless y comprueba que no supere el presupuesto.
+
+Cada medición corre en un proceso nuevo con un caché vacío: tiempo de importar app.py, de la primera
+petición (/api/process-image, que ya necesita controllers.controller) y de cargar el banco de notas
+precompilado (si existe). Los presupuestos son las claves startup/* de benchmarks/thresholds.json;
+si alguno se supera el proceso termina con código 1.
+
+Uso: python -m benchmarks.bench_startup --repeat 5 --output arranque.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+from benchmarks.bench_pipeline import THRESHOLDS_FILE, check_thresholds
+from controllers.config import BASE_DIR, SAMPLE_ARTIFACT
+
+# Se ejecuta en el proceso hijo; imprime los tiempos como JSON en la última línea
+CHILD_SCRIPT = """
+import os, json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/api/process-image')
+first_request = time.perf_counter()
+timings = {'import_app': imported - start, 'first_request': first_request - imported}
+if os.path.isfile(os.environ['POLARIS_SAMPLE_ARTIFACT']):
+    from controllers.controller import preload_samples
+    preload_samples()
+    timings['sample_bank'] = time.perf_counter() - first_request
+print(json.dumps(timings))
+"""
+
+
+def measure_once(artifact):
+    with tempfile.TemporaryDirectory() as cache_folder:
+        env = dict(os.environ, POLARIS_SERVERLESS="1", POLARIS_CACHE_DIR=cache_folder,
+                   POLARIS_SAMPLE_ARTIFACT=artifact, POLARIS_LOG_LEVEL="WARNING")
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", CHILD_SCRIPT], cwd=BASE_DIR, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings['process'] = time.perf_counter() - start  # Incluye el arranque del intérprete
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--artifact", default=SAMPLE_ARTIFACT, help="Banco de notas precompilado a medir")
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto la salida estándar)")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    args = parser.parse_args()
+
+    runs = [measure_once(args.artifact) for _ in range(args.repeat)]
+    results = []
+    for stage in ('import_app', 'first_request', 'sample_bank', 'process'):
+        values = [run[stage] for run in runs if stage in run]
+        if values:
+            # La mediana descarta el ruido de procesos aislados sin ocultar una regresión sostenida
+            results.append({'stage': 'startup', 'step': stage, 'seconds': statistics.median(values),
+                            'max_seconds': max(values)})
+            print(f"{stage:<16}{statistics.median(values):>10.3f}s", file=sys.stderr)
+
+    thresholds = {}
+    if os.path.isfile(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    regressions = check_thresholds(results, thresholds)
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'artifact': args.artifact if os.path.isfile(args.artifact) else None,
+        },
+        'results': results,
+        'regressions': regressions,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for regression in regressions:
+        print(f"FUERA DE PRESUPUESTO {regression['name']}: {regression['seconds']:.3f}s > {regression['limit']:.3f}s",
+              file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
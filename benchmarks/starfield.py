@@ -0,0 +1,47 @@
+import numpy as np
+import cv2
+
+
+def generate_starfield(width, height, density=0.0005, seed=0):
+    """
+    Genera un campo estelar sintético en escala de grises (uint8).
+
+    density es el número de estrellas por píxel; los tamaños y brillos son aleatorios
+    pero reproducibles para una misma semilla.
+    """
+    rng = np.random.default_rng(seed)
+    field = rng.normal(12, 4, size=(height, width)).astype(np.float32)  # Fondo con ruido
+
+    count = int(width * height * density)
+    xs = rng.integers(0, width, count)
+    ys = rng.integers(0, height, count)
+    brightness = rng.uniform(80, 255, count).astype(np.float32)
+    sizes = rng.integers(0, 3, count)
+
+    # Estrellas puntuales agrupadas por tamaño y difuminadas con un kernel gaussiano por grupo
+    for size, sigma in enumerate((0.8, 1.5, 2.5)):
+        points = np.zeros((height, width), dtype=np.float32)
+        mask = sizes == size
+        np.add.at(points, (ys[mask], xs[mask]), brightness[mask] * (2 * np.pi * sigma ** 2))
+        field += cv2.GaussianBlur(points, (0, 0), sigma)
+
+    return np.clip(field, 0, 255).astype(np.uint8)
+
+
+def legacy_find_stars(gray_image, min_area=3):
+    """
+    Detección original (un contorno por iteración en Python), usada como referencia en los benchmarks.
+    """
+    _, thresholded = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    star_coords_filtered = []
+    for contour in contours:
+        if cv2.contourArea(contour) >= min_area:
+            M = cv2.moments(contour)
+            if M['m00'] != 0:
+                cX = int(M['m10'] / M['m00'])
+                cY = int(M['m01'] / M['m00'])
+                star_coords_filtered.append((cY, cX))
+
+    return [{'x': int(x), 'y': int(y)} for y, x in star_coords_filtered]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from controllers.sample_bank import SampleBank, SAMPLE_RATE, CHANNELS
+from controllers.synth import NOTE_COUNT, CUT_DURATION_MS, note_frequency
+
+
+def synthetic_tone(frequency, duration_ms, sample_rate=SAMPLE_RATE, channels=CHANNELS, amplitude=0.25):
+    """
+    Tono con armónicos y caída exponencial en PCM int16 (frames, canales).
+    """
+    t = np.arange(int(sample_rate * duration_ms / 1000)) / sample_rate
+    wave = np.sin(2 * np.pi * frequency * t) + 0.5 * np.sin(4 * np.pi * frequency * t)
+    wave *= np.exp(-3 * t / max(t[-1], 1e-3)) * amplitude / 1.5
+    pcm = (wave * 32767).astype(np.int16)
+    return np.repeat(pcm[:, None], channels, axis=1)
+
+
+def synthetic_sample_bank(duration_ms=1500, cut_duration_ms=CUT_DURATION_MS, sample_rate=SAMPLE_RATE,
+                          channels=CHANNELS):
+    """
+    Banco con las mismas notas que resources/piano ("1".."88" y "cut_1".."cut_88") hecho de tonos sintéticos.
+
+    Permite medir la mezcla sin los MP3 del piano ni ffmpeg.
+    """
+    pcms = []
+    index = {}
+    offset = 0
+    for number in range(1, NOTE_COUNT + 1):
+        frequency = note_frequency(number)
+        for name, duration in ((str(number), duration_ms), (f"cut_{number}", cut_duration_ms)):
+            pcm = synthetic_tone(frequency, duration, sample_rate, channels)
+            index[name] = (offset, len(pcm))
+            pcms.append(pcm)
+            offset += len(pcm)
+    return SampleBank(np.concatenate(pcms), index, sample_rate, channels)
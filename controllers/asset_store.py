@@ -0,0 +1,175 @@
+import os
+import json
+import argparse
+import threading
+import numpy as np
+
+from controllers.config import ASSET_STORE_FOLDER
+from controllers.file_lock import file_lock
+from controllers.log import get_logger
+
+logger = get_logger("asset_store")
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class AssetStore:
+    """
+    Recursos de solo lectura (banco de notas, catálogos de estrellas) publicados una sola vez en disco
+    y mapeados en memoria por todos los procesos del servidor, que comparten así las mismas páginas.
+
+    manifest.json indica qué archivo corresponde a cada recurso. Publicar escribe un archivo nuevo
+    (nombre.v<versión>.ext) y después reemplaza el manifiesto con os.replace: un lector ve el manifiesto
+    anterior o el nuevo completo, y un archivo publicado nunca se modifica. El archivo reemplazado se
+    borra, pero los procesos que ya lo tenían mapeado lo siguen leyendo sin problema.
+    """
+
+    def __init__(self, folder=ASSET_STORE_FOLDER):
+        self.folder = folder
+        self.manifest_path = os.path.join(folder, MANIFEST_NAME)
+        self._manifest = {"version": 0, "assets": {}}
+        self._manifest_signature = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def manifest(self):
+        """
+        Manifiesto actual; solo se vuelve a leer cuando otro proceso lo reemplazó.
+        """
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return self._manifest
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)  # os.replace cambia el inodo
+        with self._lock:
+            if signature != self._manifest_signature:
+                try:
+                    with open(self.manifest_path) as f:
+                        self._manifest = json.load(f)
+                    self._manifest_signature = signature
+                except (OSError, ValueError) as e:
+                    logger.error("No se pudo leer el manifiesto de recursos: %s", e)
+            return self._manifest
+
+    @property
+    def version(self):
+        return self.manifest()["version"]
+
+    def lookup(self, name):
+        """
+        Entrada del manifiesto del recurso ({'file', 'version', 'meta'}), o None si no se ha publicado.
+        """
+        return self.manifest()["assets"].get(name)
+
+    def path(self, entry):
+        return os.path.join(self.folder, entry["file"])
+
+    def open_array(self, name):
+        """
+        Arreglo .npy publicado, mapeado en modo de solo lectura; None si no existe.
+        """
+        entry = self.lookup(name)
+        if entry is None:
+            return None
+        try:
+            return np.load(self.path(entry), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def _exclusive(self):
+        """
+        Un solo publicador a la vez, tanto entre hilos como entre procesos.
+        """
+        return file_lock(os.path.join(self.folder, LOCK_NAME), self._write_lock)
+
+    def _publish_locked(self, name, write, meta, extension):
+        self._manifest_signature = None  # Releer siempre: otro proceso pudo publicar hace un instante
+        manifest = self.manifest()
+        version = manifest["version"] + 1
+        filename = f"{name}.v{version}{extension}"
+        path = os.path.join(self.folder, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        previous = manifest["assets"].get(name)
+        entry = {"file": filename, "version": version, "meta": meta or {}}
+        updated = {"version": version, "assets": {**manifest["assets"], name: entry}}
+        tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w") as f:
+            json.dump(updated, f)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        if previous is not None and previous["file"] != filename:
+            try:
+                os.remove(os.path.join(self.folder, previous["file"]))
+            except FileNotFoundError:
+                pass
+        logger.info("Recurso %s publicado (versión %d).", name, version)
+        return entry
+
+    def publish(self, name, write, meta=None, extension=""):
+        """
+        Publica (o reemplaza) un recurso: write(ruta) escribe su contenido y meta se guarda en el manifiesto.
+        """
+        with self._exclusive():
+            return self._publish_locked(name, write, meta, extension)
+
+    def get_or_publish(self, name, write, meta=None, extension=""):
+        """
+        Como publish, pero si otro proceso ya lo publicó (o lo está haciendo) se espera y se usa el suyo;
+        así el recurso se construye una sola vez aunque arranquen varios procesos a la vez.
+        """
+        entry = self.lookup(name)
+        if entry is not None:
+            return entry
+        with self._exclusive():
+            entry = self.lookup(name)
+            if entry is not None:
+                return entry
+            return self._publish_locked(name, write, meta, extension)
+
+
+def get_asset_store():
+    """
+    Devuelve el almacén de recursos compartido de este proceso, creándolo la primera vez.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AssetStore()
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacén de recursos compartido entre procesos del servidor.")
+    parser.add_argument("command", choices=["status", "warm"],
+                        help="status: muestra el manifiesto; warm: publica las notas y los catálogos de IMAGE_URLS")
+    args = parser.parse_args()
+    if args.command == "warm":
+        # Pensado para ejecutarse antes de arrancar los procesos de trabajo (p. ej. on_starting de gunicorn)
+        from controllers.controller import publish_shared_assets
+
+        publish_shared_assets()
+    store = get_asset_store()
+    manifest = store.manifest()
+    print(f"{store.folder} (versión {manifest['version']})")
+    for name, entry in sorted(manifest["assets"].items()):
+        try:
+            size = os.path.getsize(store.path(entry)) / 1e6
+        except OSError:
+            size = float("nan")
+        print(f"  {name}  {size:.1f} MB  v{entry['version']}")
+
+
+if __name__ == "__main__":
+    main()
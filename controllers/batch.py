@@ -0,0 +1,230 @@
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from controllers.config import BATCH_DOWNLOAD_WORKERS, BATCH_DETECT_WORKERS, RENDER_WORKERS, JOB_TTL
+from controllers.jobs import QueueFullError
+from controllers.log import get_logger
+
+logger = get_logger("batch")
+
+SUBMIT_RETRY_DELAY = 1  # Segundos de espera si la cola de renderizado está llena
+
+
+class BatchItem:
+    """
+    Un elemento del lote: una imagen del catálogo con sus parámetros de renderizado.
+    """
+
+    def __init__(self, position, spec):
+        self.position = position
+        self.spec = spec  # {'index', 'maxStars', 'interval', 'format', 'instrument', 'velocity', 'pan'}
+        self.status = "pending"  # pending -> rendering -> done | error | cancelled
+        self.error = None
+        self.job = None
+        self.timings = {}
+
+    def fail(self, message):
+        self.status = "error"
+        self.error = message
+
+    def refresh(self):
+        """
+        Toma el estado del trabajo de renderizado asociado, si ya existe.
+        """
+        if self.job is None or self.status != "rendering" or self.job.active:
+            return
+        self.status = self.job.status
+        self.error = self.job.message
+        self.timings.update(self.job.profile or {})
+
+    def to_dict(self):
+        self.refresh()
+        item = {'position': self.position, **self.spec, 'status': self.status, 'error': self.error,
+                'timings': self.timings}
+        if self.job is not None:
+            item['job_id'] = self.job.id
+            item['cached'] = self.job.cached
+            item['progress'] = self.job.progress
+            if self.status == 'done':
+                item['download_url'] = f'/api/download-audio?job={self.job.id}'
+        return item
+
+
+class Batch:
+    """
+    Conjunto de renderizados pedidos en una sola llamada; su manifiesto resume cada elemento.
+    """
+
+    def __init__(self, batch_id, items):
+        self.id = batch_id
+        self.items = items
+        self.created = time.time()
+        self.finished = None
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+        for item in self.items:
+            if item.job is not None:
+                item.job.cancel()
+
+    @property
+    def active(self):
+        return self.finished is None
+
+    def to_dict(self):
+        items = [item.to_dict() for item in self.items]
+        summary = {}
+        for item in items:
+            summary[item['status']] = summary.get(item['status'], 0) + 1
+        return {
+            'id': self.id,
+            'status': 'running' if self.active else ('cancelled' if self.cancel_event.is_set() else 'done'),
+            'created': self.created,
+            'finished': self.finished,
+            'summary': summary,
+            'items': items,
+        }
+
+
+class BatchManager:
+    """
+    Ejecuta lotes como un pipeline de tres etapas: descarga, detección y mezcla.
+
+    Cada imagen distinta se descarga y se detecta una sola vez en pools propios, de modo que las
+    descargas se solapan con las detecciones; en cuanto una imagen está lista, sus elementos pasan
+    a la cola de renderizado compartida. Cada lote tiene como máximo max_inflight trabajos de mezcla
+    a la vez para no ocupar toda la cola, y un fallo solo afecta a los elementos de esa imagen.
+    """
+
+    def __init__(self, fetch, detect, submit_render, download_workers=BATCH_DOWNLOAD_WORKERS,
+                 detect_workers=BATCH_DETECT_WORKERS, max_inflight=RENDER_WORKERS, ttl=JOB_TTL):
+        self.fetch = fetch  # fetch(index): descarga la imagen (o la toma del caché)
+        self.detect = detect  # detect(index): detecta las estrellas; lanza una excepción si falla
+        self.submit_render = submit_render  # submit_render(spec): devuelve el Job de la mezcla
+        self.max_inflight = max_inflight
+        self.ttl = ttl
+        self._download_pool = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="batch-download")
+        self._detect_pool = ThreadPoolExecutor(max_workers=detect_workers, thread_name_prefix="batch-detect")
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def submit(self, specs):
+        """
+        Crea el lote y lo procesa en segundo plano; devuelve el Batch para consultar su manifiesto.
+
+        Los elementos con error de validación (spec con la clave 'error') se registran como fallidos.
+        """
+        self._purge_expired()
+        items = []
+        for position, spec in enumerate(specs):
+            item = BatchItem(position, {key: value for key, value in spec.items() if key != 'error'})
+            if spec.get('error'):
+                item.fail(spec['error'])
+            items.append(item)
+        batch = Batch(uuid.uuid4().hex, items)
+        with self._lock:
+            self._batches[batch.id] = batch
+        threading.Thread(target=self._run, args=(batch,), name=f"batch-{batch.id[:8]}", daemon=True).start()
+        return batch
+
+    def get(self, batch_id):
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def cancel(self, batch_id):
+        batch = self.get(batch_id)
+        if batch is not None:
+            batch.cancel()
+        return batch
+
+    def _prepare(self, index, ready):
+        """
+        Etapas 1 y 2 de una imagen: la descarga corre en este hilo y la detección se encadena en su pool.
+        """
+        timings = {}
+        try:
+            start = time.perf_counter()
+            self.fetch(index)
+            timings['download'] = round(time.perf_counter() - start, 6)
+        except Exception as e:
+            ready.put((index, timings, f"No se pudo descargar la imagen: {e}"))
+            return
+
+        def detect():
+            try:
+                start = time.perf_counter()
+                self.detect(index)
+                timings['detect'] = round(time.perf_counter() - start, 6)
+                ready.put((index, timings, None))
+            except Exception as e:
+                ready.put((index, timings, str(e)))
+
+        self._detect_pool.submit(detect)
+
+    def _run(self, batch):
+        pending = {}
+        for item in batch.items:
+            if item.status == "pending":
+                pending.setdefault(item.spec['index'], []).append(item)
+
+        ready = queue.Queue()
+        for index in pending:
+            self._download_pool.submit(self._prepare, index, ready)
+
+        inflight = []
+        try:
+            for _ in range(len(pending)):
+                index, timings, error = ready.get()
+                for item in pending[index]:
+                    item.timings.update(timings)
+                    if batch.cancel_event.is_set():
+                        item.status = "cancelled"
+                    elif error is not None:
+                        item.fail(error)
+                    else:
+                        inflight = self._wait_for_slot(batch, inflight)
+                        self._submit_item(batch, item)
+                        if item.job is not None:
+                            inflight.append(item.job)
+            for job in inflight:
+                job.finished_event.wait()
+        except Exception as e:
+            logger.error("Error en el lote %s: %s", batch.id, e)
+            for item in batch.items:
+                if item.status == "pending":
+                    item.fail(str(e))
+        finally:
+            batch.finished = time.time()
+            logger.info("Lote %s terminado: %s", batch.id, batch.to_dict()['summary'])
+
+    def _wait_for_slot(self, batch, inflight):
+        while True:
+            inflight = [job for job in inflight if job.active]
+            if len(inflight) < self.max_inflight or batch.cancel_event.is_set():
+                return inflight
+            inflight[0].finished_event.wait(SUBMIT_RETRY_DELAY)
+
+    def _submit_item(self, batch, item):
+        while not batch.cancel_event.is_set():
+            try:
+                item.job = self.submit_render(item.spec)
+                item.status = "rendering"
+                return
+            except QueueFullError:
+                # Otros clientes llenaron la cola: esperar en lugar de fallar el elemento
+                batch.cancel_event.wait(SUBMIT_RETRY_DELAY)
+            except Exception as e:
+                item.fail(str(e))
+                return
+        item.status = "cancelled"
+
+    def _purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for batch_id in [batch_id for batch_id, batch in self._batches.items()
+                             if batch.finished and now - batch.finished > self.ttl]:
+                del self._batches[batch_id]
@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+# Carpeta raíz del proyecto (un nivel por encima de controllers/)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modo serverless (Vercel): sin precargas al importar la app y con los cachés en el directorio temporal,
+# el único escribible en la función
+SERVERLESS = bool(os.environ.get("POLARIS_SERVERLESS") or os.environ.get("VERCEL"))
+
+# Carpeta para cachés en disco; se puede cambiar con POLARIS_CACHE_DIR
+CACHE_FOLDER = os.environ.get("POLARIS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "polaris-cache") if SERVERLESS
+                              else os.path.join(BASE_DIR, "resources", "cache"))
+
+# Banco de notas precompilado (python -m controllers.sample_bank build); se carga con un único mmap
+SAMPLE_ARTIFACT = os.environ.get("POLARIS_SAMPLE_ARTIFACT", os.path.join(BASE_DIR, "resources", "samples.bin"))
+
+# Caché de imágenes descargadas (por defecto 512 MB)
+IMAGE_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "images")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("POLARIS_IMAGE_CACHE_MB", "512")) * 1024 * 1024
+IMAGE_DOWNLOAD_MAX_BYTES = int(os.environ.get("POLARIS_DOWNLOAD_MAX_MB", "256")) * 1024 * 1024
+
+# Servidor alternativo con las mismas rutas que el catálogo (p. ej. el de benchmarks/bench_load.py);
+# vacío para descargar de stsci-opo.org y webbtelescope.org
+IMAGE_MIRROR = os.environ.get("POLARIS_IMAGE_MIRROR", "")
+
+# Presupuesto por imagen al decodificar: píxeles en escala de grises para detectar y memoria estimada
+# del decodificador; las imágenes que lo superan se reducen ("downsample") o se rechazan ("reject").
+# El límite de PIL contra bombas de descompresión (2 * Image.MAX_IMAGE_PIXELS) se sigue aplicando antes
+DECODE_MAX_PIXELS = int(os.environ.get("POLARIS_DECODE_MAX_PIXELS", str(256 * 1024 * 1024)))
+DECODE_MEMORY_BUDGET = int(os.environ.get("POLARIS_DECODE_MEMORY_MB", "1024")) * 1024 * 1024
+DECODE_OVERSIZE = os.environ.get("POLARIS_DECODE_OVERSIZE", "downsample")
+
+# Recursos de solo lectura (banco de notas y catálogos de estrellas) compartidos entre procesos vía mmap
+ASSET_STORE_FOLDER = os.path.join(CACHE_FOLDER, "assets")
+
+# Caché de catálogos de estrellas (los arreglos viven en el almacén de recursos)
+STAR_CACHE_MEMORY_ENTRIES = 64
+
+# Índice espacial de estrellas para las consultas por región
+STAR_INDEX_CELL_STARS = 16  # Estrellas promedio por celda de la cuadrícula
+STAR_QUERY_DEFAULT_LIMIT = 1000
+STAR_QUERY_MAX_LIMIT = 50000
+
+# Detección por mosaicos para imágenes muy grandes
+DETECTION_TILE_SIZE = int(os.environ.get("POLARIS_TILE_SIZE", "2048"))
+DETECTION_TILE_OVERLAP = 64  # Debe ser mayor que la estrella más grande que se quiera conservar
+# En serverless no suele haber /dev/shm ni semáforos de multiprocessing: por defecto, sin pool de procesos
+DETECTION_WORKERS = int(os.environ.get("POLARIS_DETECTION_WORKERS", "1" if SERVERLESS else str(os.cpu_count() or 1)))
+TILED_DETECTION_MIN_PIXELS = int(os.environ.get("POLARIS_TILED_MIN_PIXELS", str(16 * 1024 * 1024)))
+
+# Cola de renderizado: hilos de trabajo, trabajos en espera antes de responder 429 y vida de los resultados
+RENDER_WORKERS = int(os.environ.get("POLARIS_RENDER_WORKERS", "2"))
+RENDER_QUEUE_LIMIT = int(os.environ.get("POLARIS_RENDER_QUEUE_LIMIT", "16"))
+JOBS_OUTPUT_FOLDER = os.path.join(CACHE_FOLDER, "jobs")
+JOB_TTL = 3600
+
+# Caché de audios ya renderizados (por defecto 1 GB)
+RESULT_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "results")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("POLARIS_RESULT_CACHE_MB", "1024")) * 1024 * 1024
+
+# Registro: nivel (DEBUG, INFO, WARNING...) y máximo de mensajes iguales por intervalo
+LOG_LEVEL = os.environ.get("POLARIS_LOG_LEVEL", "INFO").upper()
+LOG_RATE_LIMIT = int(os.environ.get("POLARIS_LOG_RATE_LIMIT", "10"))
+LOG_RATE_PERIOD = 60  # segundos
+
+# Lotes de renderizado: descargas y detecciones en paralelo, y máximo de elementos por lote
+BATCH_DOWNLOAD_WORKERS = int(os.environ.get("POLARIS_BATCH_DOWNLOAD_WORKERS", "4"))
+BATCH_DETECT_WORKERS = int(os.environ.get("POLARIS_BATCH_DETECT_WORKERS", "2"))
+BATCH_MAX_ITEMS = 500
+
+# Puntos de control de la mezcla para re-renderizar solo lo que cambia al ajustar maxStars (por defecto 256 MB)
+MIX_CHECKPOINT_MAX_BYTES = int(os.environ.get("POLARIS_CHECKPOINT_MB", "256")) * 1024 * 1024
+MIX_CHECKPOINT_SPACING = 64  # Notas entre puntos de control (se duplica si hay demasiados)
+MIX_CHECKPOINT_MAX = 32  # Puntos de control por imagen e intervalo
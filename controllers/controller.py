@@ -1,15 +1,38 @@
 import os
+import json
 import numpy as np
 from PIL import Image
-from pydub import AudioSegment
 import requests
-from io import BytesIO
 import cv2
 import threading
+from urllib.parse import urlsplit
+
+from controllers.config import BASE_DIR, IMAGE_MIRROR, TILED_DETECTION_MIN_PIXELS, SAMPLE_ARTIFACT, STAR_QUERY_DEFAULT_LIMIT
+from controllers.sample_bank import get_sample_bank
+from controllers.synth import get_synth_bank
+from controllers.mixer import plan_mix, mix_notes, iter_mix_chunks
+from controllers.mix_checkpoints import MixCheckpoints, mix_incremental
+from controllers.encoders import encode_audio, AUDIO_FORMATS, DEFAULT_AUDIO_FORMAT
+from controllers.image_cache import ImageCache
+from controllers.star_cache import StarCache, StarCatalog
+from controllers.jobs import JobManager
+from controllers.batch import BatchManager
+from controllers.result_cache import ResultCache, result_key
+from controllers.detection import detect_stars, detect_stars_tiled, as_star_array, stars_to_coords
+from controllers.image_decode import load_grayscale, to_source_stars
+from controllers.log import get_logger
+from controllers.metrics import timed, profiling, cache_result, STARS_DETECTED, NOTES_MIXED, QUEUE_DEPTH
 
 # Definir la constante para el nombre del archivo de audio generado
 DEFAULT_OUTPUT_FILENAME = "audio_coordenadas_estelares.mp3"
-AUDIO_FOLDER = "../output"
+AUDIO_FOLDER = os.path.join(BASE_DIR, "resources", "piano")
+MIN_STAR_AREA = 8  # Umbral mínimo de área (en píxeles) para retener una estrella
+INSTRUMENTS = ("piano", "synth")  # piano: notas MP3 de AUDIO_FOLDER; synth: sintetizador NumPy sin archivos
+DEFAULT_INSTRUMENT = "piano"
+
+logger = get_logger("controller")
+
+cancel_processing = False  # Indicador global de cancelación (start_audio_creation / cancel_audio_processing)
 
 # Definir la lista de URLs de imágenes
 IMAGE_URLS = [
@@ -35,129 +58,448 @@ IMAGE_URLS = [
     "https://webbtelescope.org/files/live/sites/webb/files/home/resource-gallery/_images/wt-image-resources.jpg?t=tn1600"
 ]
 
+
+def mirror_url(url, mirror):
+    """
+    La misma ruta (y consulta) de url, pero servida por mirror.
+    """
+    return mirror.rstrip("/") + urlsplit(url)._replace(scheme="", netloc="").geturl()
+
+
+if IMAGE_MIRROR:
+    IMAGE_URLS[:] = [mirror_url(url, IMAGE_MIRROR) for url in IMAGE_URLS]
+
 def fetch_image_urls():
     """
     Devuelve la lista de URLs de las imágenes ya predefinidas.
     """
     if not IMAGE_URLS:
-        print("No se encontraron URLs de imágenes.")
+        logger.warning("No se encontraron URLs de imágenes.")
     return IMAGE_URLS
 
 
+def preload_samples():
+    """
+    Carga (y decodifica si hace falta) el banco de notas al iniciar el proceso.
+    """
+    return get_sample_bank(AUDIO_FOLDER, SAMPLE_ARTIFACT)
+
+
+def publish_shared_assets():
+    """
+    Publica en el almacén compartido las notas de AUDIO_FOLDER y los catálogos de estrellas de IMAGE_URLS,
+    para que los procesos de trabajo que arranquen después solo tengan que mapearlos.
+    """
+    preload_samples()
+    for url in IMAGE_URLS:
+        try:
+            catalog = get_star_catalog(url)
+        except Exception as e:
+            # Una imagen dañada o fuera del presupuesto no debe impedir publicar las demás
+            logger.error("Error al detectar las estrellas de %s: %s", url, e)
+            catalog = None
+        if catalog is None:
+            logger.warning("No se pudo publicar el catálogo de %s.", url)
+
+
+def get_instrument_bank(instrument=DEFAULT_INSTRUMENT):
+    """
+    Devuelve el banco de notas del instrumento; si no hay notas de piano disponibles se usa el sintetizador.
+    """
+    if instrument == "piano":
+        bank = get_sample_bank(AUDIO_FOLDER, SAMPLE_ARTIFACT)
+        if len(bank):
+            return bank
+        logger.warning("No hay notas de piano en %s; se usa el sintetizador.", AUDIO_FOLDER)
+    return get_synth_bank()
+
+
+def note_gains(stars, image_width, channels, velocity=False, pan=False):
+    """
+    Ganancia por canal de cada estrella: el brillo da la intensidad y la posición x el panorama estéreo.
+
+    Devuelve None si no se pidió ninguna de las dos, para mezclar las notas tal cual.
+    """
+    if not velocity and not pan:
+        return None
+    gains = np.ones((len(stars), channels), dtype=np.float32)
+    if velocity:
+        # Escala logarítmica: el flujo de las estrellas abarca varios órdenes de magnitud
+        loudness = np.log1p(stars['flux'].astype(np.float64))
+        gains *= map_to_scale(loudness, loudness.min(), loudness.max(), 0.35, 1.0)[:, None]
+    if pan and channels == 2:
+        # Panorama de potencia constante: izquierda = cos, derecha = sin
+        angle = np.clip(stars['x'] / max(image_width - 1, 1), 0, 1) * np.pi / 2
+        gains[:, 0] *= np.cos(angle)
+        gains[:, 1] *= np.sin(angle)
+    return gains
+
+
+_image_cache = None
+_star_cache = None
+_job_manager = None
+_result_cache = None
+_batch_manager = None
+_mix_checkpoints = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """
+    Devuelve el caché de imágenes compartido (con su sesión HTTP), creándolo la primera vez.
+    """
+    global _image_cache
+    with _cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
+
+
+def get_star_cache():
+    """
+    Devuelve el caché de catálogos de estrellas compartido, creándolo la primera vez.
+    """
+    global _star_cache
+    with _cache_lock:
+        if _star_cache is None:
+            _star_cache = StarCache()
+        return _star_cache
+
+
+def get_job_manager():
+    """
+    Devuelve la cola de renderizado compartida, creándola la primera vez.
+    """
+    global _job_manager
+    with _cache_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+            QUEUE_DEPTH.set_function(_job_manager.queue_depth)
+        return _job_manager
+
+
+def get_result_cache():
+    """
+    Devuelve el caché de audios renderizados compartido, creándolo la primera vez.
+    """
+    global _result_cache
+    with _cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
+
+
+def get_mix_checkpoints():
+    """
+    Devuelve los puntos de control de mezcla compartidos, creándolos la primera vez.
+    """
+    global _mix_checkpoints
+    with _cache_lock:
+        if _mix_checkpoints is None:
+            _mix_checkpoints = MixCheckpoints()
+        return _mix_checkpoints
+
+
+def get_batch_manager():
+    """
+    Devuelve el gestor de lotes compartido, creándolo la primera vez.
+    """
+    global _batch_manager
+    with _cache_lock:
+        if _batch_manager is None:
+            _batch_manager = BatchManager(_fetch_catalog_image, _detect_catalog_image, _submit_batch_item)
+        return _batch_manager
+
+
+def start_image_prefetch():
+    """
+    Precarga en segundo plano todas las imágenes del catálogo.
+    """
+    return get_image_cache().start_prefetch(IMAGE_URLS)
+
+
 def download_image_from_url(url):
     """
-    Descarga una imagen desde una URL y la carga en un objeto PIL Image.
+    Descarga una imagen desde una URL (o la toma del caché) y la carga en un objeto PIL Image.
     """
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Verificar que la petición fue exitosa
-        img = Image.open(BytesIO(response.content))
+        _, path = get_image_cache().fetch(url)
+        img = Image.open(path)
         return img
     except requests.exceptions.RequestException as e:
-        print(f"Error al descargar la imagen: {e}")
+        logger.error("Error al descargar la imagen: %s", e)
         return None
 
 
-def find_stars(image):
+def get_star_catalog(url, min_area=MIN_STAR_AREA):
     """
-    Detecta las estrellas en la imagen, retornando las coordenadas de las mismas.
+    Devuelve el StarCatalog de la imagen de la URL; si ya se detectó antes, no decodifica la imagen.
+    """
+    try:
+        image_hash, path = get_image_cache().fetch(url)
+    except requests.exceptions.RequestException as e:
+        logger.error("Error al descargar la imagen: %s", e)
+        return None
+
+    star_cache = get_star_cache()
+    catalog = star_cache.get(image_hash, min_area)
+    cache_result("stars", catalog is not None)
+    if catalog is None:
+        stars, width, height = detect_image_file(path, min_area)
+        catalog = star_cache.put(image_hash, min_area, StarCatalog(stars, width, height, image_hash))
+    return catalog
+
+
+def detect_image_file(path, min_area=MIN_STAR_AREA):
     """
-    min_area = 3  # Umbral mínimo de área para retener una estrella
+    Decodifica la imagen del archivo dentro del presupuesto de memoria y detecta sus estrellas.
 
-    image_array = np.array(image.convert('RGB'))
-    gray_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+    Devuelve (estrellas, ancho, alto) en coordenadas de la imagen original aunque se haya reducido;
+    lanza ImageTooLargeError si no cabe en el presupuesto.
+    """
+    with timed("decode"):
+        gray_image, (width, height) = load_grayscale(path)
+    # En una imagen reducida las estrellas ocupan menos píxeles
+    detect_area = max(1, round(min_area * gray_image.size / (width * height)))
+    with timed("detect"):
+        if gray_image.size >= TILED_DETECTION_MIN_PIXELS:
+            stars = detect_stars_tiled(gray_image, detect_area)
+        else:
+            stars = detect_stars(gray_image, detect_area)
+    stars = to_source_stars(stars, gray_image.shape, (width, height))
+    STARS_DETECTED.inc(len(stars))
+    return stars, width, height
 
-    _, thresholded = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-    star_coords_filtered = []
-    for contour in contours:
-        if cv2.contourArea(contour) >= min_area:
-            M = cv2.moments(contour)
-            if M['m00'] != 0:
-                cX = int(M['m10'] / M['m00'])
-                cY = int(M['m01'] / M['m00'])
-                star_coords_filtered.append((cY, cX))
-    
-    return [{'x': int(x), 'y': int(y)} for y, x in star_coords_filtered], image_array
+def query_stars(url, region, filters, offset=0, limit=STAR_QUERY_DEFAULT_LIMIT):
+    """
+    Página de las estrellas de la imagen dentro de region (x0, y0, x1, y1) que cumplen filters
+    (min_area, max_area, min_mag, max_mag). Devuelve (catalog, columnas, total), o None si falla la descarga.
+    """
+    catalog = get_star_catalog(url)
+    if catalog is None:
+        return None
+    with timed("star_query"):
+        indices = catalog.index.query(*region, **filters)
+        columns = catalog.index.columns_for(indices[offset:offset + limit])
+    return catalog, columns, len(indices)
+
 
-def create_audio_from_coordinates(coords, image_width, output_filename, max_stars, interval_between_starts, update_progress, finish_callback):
+def cached_star_counts(min_area=MIN_STAR_AREA):
     """
-    Genera un archivo de audio a partir de las coordenadas de estrellas detectadas.
+    Número de estrellas ya detectadas por índice de imagen (None si aún no se ha procesado).
     """
-    global cancel_processing
-    if not coords:
-        print("No se encontraron coordenadas.")
-        return
+    image_cache = get_image_cache()
+    star_cache = get_star_cache()
+    counts = {}
+    for i, url in enumerate(IMAGE_URLS):
+        image_hash = image_cache.lookup(url)
+        counts[i] = star_cache.count(image_hash, min_area) if image_hash else None
+    return counts
 
-    coords.sort(key=lambda coord: coord['x'])  # Ordenar coordenadas por el eje X
 
-    if max_stars is not None and len(coords) > max_stars:
-        coords = coords[:max_stars]
+def find_stars(image, min_area=MIN_STAR_AREA):
+    """
+    Detecta las estrellas en la imagen, retornando las coordenadas de las mismas.
+    """
+    with timed("decode"):
+        image_array = np.array(image.convert('RGB'))
+        gray_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+    with timed("detect"):
+        stars = detect_stars(gray_image, min_area)
+    STARS_DETECTED.inc(len(stars))
+    return stars_to_coords(stars), image_array
 
-    y_values = [coord['y'] for coord in coords]
-    original_min_y = min(y_values)
-    original_max_y = max(y_values)
+def create_audio_from_coordinates(coords, image_width, output_filename, max_stars, interval_between_starts, update_progress, finish_callback, should_cancel=None, stream=None, audio_format=DEFAULT_AUDIO_FORMAT, bank=None, instrument=DEFAULT_INSTRUMENT, velocity=False, pan=False, checkpoint_key=None):
+    """
+    Genera un archivo de audio a partir de las estrellas detectadas (arreglo STAR_DTYPE o lista de {'x', 'y'}).
 
-    total_duration = (len(coords) - 1) * interval_between_starts + 1000  # Extra 1000ms para seguridad
-    min_audio_duration = 10000  # 10 segundos en milisegundos
+    should_cancel permite usar una señal de cancelación propia; por defecto se usa la global.
+    Si se pasa un AudioStream, la mezcla se escribe en él por bloques a medida que se genera.
+    audio_format es una de las claves de AUDIO_FORMATS (wav, flac, mp3, opus).
+    bank permite usar otro SampleBank en lugar de las notas de AUDIO_FOLDER (p. ej. en los benchmarks).
+    instrument elige el banco (ver INSTRUMENTS); velocity y pan usan el brillo y la posición x de cada estrella.
+    checkpoint_key (p. ej. hash de la imagen e intervalo) permite reutilizar la mezcla de un render anterior
+    cuando solo cambió maxStars; no se usa al transmitir.
+    """
+    if should_cancel is None:
+        should_cancel = lambda: cancel_processing
+    if len(coords) == 0:
+        logger.warning("No se encontraron coordenadas.")
+        return
 
-    if total_duration < min_audio_duration:
-        total_duration = min_audio_duration
+    stars = as_star_array(coords)  # Ordenadas por el eje X
 
-    base_audio = AudioSegment.silent(duration=total_duration)
-    current_time = 0
-    total_coords = len(coords)
-    processed_coords = 0
+    if max_stars is not None and len(stars) > max_stars:
+        stars = stars[:max_stars]
 
-    for coord in coords:
-        if cancel_processing:
-            print("Procesamiento de audio cancelado.")
-            update_progress(0)
-            return
-        
-        processed_coords += 1
-        progress = (processed_coords / total_coords) * 100
-        update_progress(progress)
+    y_values = stars['y']
+    note_numbers = map_to_scale(y_values, y_values.min(), y_values.max(), 25, 75).astype(int)
 
-        x = coord['x']
-        y = coord['y']
+    if bank is None:
+        bank = get_instrument_bank(instrument)
+    gains = note_gains(stars, image_width, bank.channels, velocity, pan)
+    plan = plan_mix(note_numbers, bank, interval_between_starts, gains)
+    if len(plan) < len(note_numbers):
+        logger.warning("%d notas no encontradas en el banco de %s.", len(note_numbers) - len(plan), instrument)
 
-        try:
-            y_mapped = map_to_scale(y, original_min_y, original_max_y, 25, 75)
-            x_mapped = map_to_scale(x, 0, image_width, 0, total_duration)
-        except ValueError as e:
-            print(f"Error al mapear x={x} o y={y}: {e}")
-            continue
-
-        if 25 <= y_mapped <= 75:
-            file_name = os.path.join(AUDIO_FOLDER, f"{int(y_mapped)}.mp3")
-            
-            try:
-                sound = AudioSegment.from_mp3(file_name)
-                sound_duration = len(sound)
-                end_time = current_time + sound_duration
-
-                if end_time > len(base_audio):
-                    extra_duration = end_time - len(base_audio)
-                    base_audio = base_audio + AudioSegment.silent(duration=extra_duration)
-
-                print(f"Superponiendo {file_name} en la posición {current_time / 1000} segundos.")
-                base_audio = base_audio.overlay(sound, position=int(current_time))
-                current_time += interval_between_starts
-            except FileNotFoundError:
-                print(f"Archivo {file_name} no encontrado.")
-    
-    if base_audio.duration_seconds > 0:
-        base_audio.export(output_filename, format="mp3")
-        print(f"Audio guardado como: {output_filename}")
+    logger.info("Superponiendo %d notas en %.1f segundos de audio.", len(plan), plan.total_frames / bank.sample_rate)
+    with timed("mix"):
+        if stream is not None:
+            pcm = _mix_to_stream(plan, bank, stream, update_progress, should_cancel)
+        elif checkpoint_key is not None:
+            pcm, reused = mix_incremental(plan, bank, interval_between_starts, get_mix_checkpoints(),
+                                          (checkpoint_key, instrument), update_progress, should_cancel)
+            cache_result("checkpoint", reused > 0)
+            if reused:
+                logger.info("Reutilizadas %d de %d notas de una mezcla anterior.", reused, len(plan))
+        else:
+            pcm = mix_notes(plan, bank, update_progress, should_cancel)
+    if pcm is None:
+        logger.info("Procesamiento de audio cancelado.")
+        update_progress(0)
+        return
+
+    if len(pcm) > 0:
+        NOTES_MIXED.inc(len(plan))
+        with timed("encode"):
+            encode_audio(pcm, bank.sample_rate, bank.channels, output_filename, audio_format)
+        logger.info("Audio guardado como: %s", output_filename)
         finish_callback(True)
     else:
-        print("No se generó audio.")
+        logger.warning("No se generó audio.")
         finish_callback(False)
     
     update_progress(100)
 
+def _mix_to_stream(plan, bank, stream, update_progress, should_cancel):
+    """
+    Mezcla por bloques escribiendo cada uno en el stream; devuelve la pista completa o None si se canceló.
+    """
+    stream.start(plan.total_frames, bank.sample_rate, bank.channels)
+    pcm = np.empty((plan.total_frames, bank.channels), dtype=np.int16)
+    position = 0
+    for chunk in iter_mix_chunks(plan, bank, update_progress=update_progress, should_cancel=should_cancel):
+        stream.write(chunk)
+        pcm[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    stream.close()
+    return pcm if position == plan.total_frames else None
+
+
+def render_audio_job(render, image_url, max_stars, interval_between_starts, audio_format=DEFAULT_AUDIO_FORMAT,
+                     instrument=DEFAULT_INSTRUMENT, velocity=False, pan=False):
+    """
+    Ejecuta el pipeline completo (descarga, detección y mezcla) de un renderizado de la cola.
+    """
+    catalog = get_star_catalog(image_url)
+    if catalog is None:
+        raise RuntimeError("No se pudo descargar la imagen")
+    if len(catalog) == 0:
+        raise RuntimeError("No se encontraron estrellas en la imagen")
+
+    def finish(success):
+        if not success:
+            render.status = "error"
+            render.message = "No se generó audio"
+
+    # Con el hash de la imagen ya conocido, otro trabajo pudo haber generado este mismo audio
+    key = _result_key(catalog.image_hash, _render_params(max_stars, interval_between_starts, audio_format,
+                                                         instrument, velocity, pan))
+    extension = AUDIO_FORMATS[audio_format]["extension"]
+    if key is not None and render.stream is None:
+        cached = get_result_cache().copy_to(key, extension, render.output_path)
+        cache_result("result", cached)
+        if cached:
+            render.cached = True
+            return
+
+    create_audio_from_coordinates(catalog.stars, catalog.width, render.output_path, max_stars, interval_between_starts,
+                                  render.update_progress, finish, render.is_cancelled, render.stream, audio_format,
+                                  instrument=instrument, velocity=velocity, pan=pan,
+                                  checkpoint_key=(catalog.image_hash, interval_between_starts))
+
+    if key is not None and render.status == "running" and not render.is_cancelled() and \
+            os.path.isfile(render.output_path):
+        get_result_cache().put(key, extension, render.output_path)
+
+
+def _render_params(max_stars, interval_between_starts, audio_format, instrument=DEFAULT_INSTRUMENT, velocity=False,
+                   pan=False):
+    """
+    Todo lo que, además de la imagen, determina el audio generado, incluida la huella de las notas del
+    instrumento (el audio guardado deja de valer si cambian las notas).
+    """
+    return {'maxStars': max_stars, 'interval': interval_between_starts, 'minArea': MIN_STAR_AREA,
+            'format': audio_format, 'instrument': instrument, 'velocity': velocity, 'pan': pan,
+            'bank': get_instrument_bank(instrument).fingerprint}
+
+
+def _result_key(image_hash, render_params):
+    """
+    Clave del caché de resultados, o None si el banco de notas no tiene huella (p. ej. está incompleto).
+    """
+    if render_params['bank'] is None:
+        return None
+    return result_key(image_hash, render_params)
+
+
+def submit_audio_job(index, max_stars, interval_between_starts, stream=False, audio_format=DEFAULT_AUDIO_FORMAT,
+                     profile=False, instrument=DEFAULT_INSTRUMENT, velocity=False, pan=False):
+    """
+    Encola la creación de audio para la imagen del índice dado; lanza QueueFullError si la cola está llena.
+
+    Si el audio ya está en el caché de resultados se devuelve un trabajo terminado sin encolar nada,
+    y las peticiones idénticas simultáneas comparten el mismo trabajo.
+    Con profile=True el trabajo guarda el tiempo de cada etapa en job.profile.
+    """
+    params = {'index': index, 'maxStars': max_stars, 'interval': interval_between_starts, 'format': audio_format,
+              'instrument': instrument, 'velocity': velocity, 'pan': pan}
+    image_url = IMAGE_URLS[index]
+    render_params = _render_params(max_stars, interval_between_starts, audio_format, instrument, velocity, pan)
+    extension = AUDIO_FORMATS[audio_format]["extension"]
+
+    with profiling({} if profile else None) as stages, timed("cache_lookup"):
+        image_hash = get_image_cache().lookup(image_url)
+        key = _result_key(image_hash, render_params) if image_hash is not None else None
+        job = None
+        if key is not None:
+            job = get_job_manager().add_completed(lambda path: get_result_cache().copy_to(key, extension, path),
+                                                  params, extension, stages)
+    if job is not None:
+        cache_result("result", True)
+        return job
+
+    dedupe_key = json.dumps({'url': image_url, **render_params}, sort_keys=True)
+    return get_job_manager().submit(
+        lambda render: render_audio_job(render, image_url, max_stars, interval_between_starts, audio_format, instrument,
+                                     velocity, pan), params, extension=extension, stream=stream, dedupe_key=dedupe_key, profile=stages)
+
+
+def _fetch_catalog_image(index):
+    get_image_cache().fetch(IMAGE_URLS[index])
+
+
+def _detect_catalog_image(index):
+    catalog = get_star_catalog(IMAGE_URLS[index])
+    if catalog is None:
+        raise RuntimeError("No se pudo descargar la imagen")
+    if len(catalog) == 0:
+        raise RuntimeError("No se encontraron estrellas en la imagen")
+
+
+def _submit_batch_item(spec):
+    return submit_audio_job(spec['index'], spec['maxStars'], spec['interval'], audio_format=spec['format'],
+                            profile=True, instrument=spec['instrument'], velocity=spec['velocity'], pan=spec['pan'])
+
+
+def submit_batch(specs):
+    """
+    Procesa varios renderizados en un solo lote; ver BatchManager para el orden de las etapas.
+    """
+    return get_batch_manager().submit(specs)
+
+
 def start_audio_creation(coords, image_width, output_filename, max_stars, interval_between_starts, update_progress, finish_callback):
     """
     Inicia la creación del archivo de audio en un nuevo hilo.
@@ -177,8 +519,9 @@ def cancel_audio_processing():
 
 def map_to_scale(value, old_min, old_max, new_min, new_max):
     """
-    Mapea un valor de un rango antiguo a uno nuevo.
+    Mapea un valor (o un arreglo de valores) de un rango antiguo a uno nuevo.
     """
     if old_max == old_min:
-        return (new_min + new_max) / 2  # Valor por defecto en el medio del nuevo rango
-    return new_min + (value - old_min) * (new_max - new_min) / (old_max - new_min)
+        # Valor por defecto en el medio del nuevo rango
+        return np.zeros_like(value, dtype=float) + (new_min + new_max) / 2
+    return new_min + (np.asarray(value) - old_min) * (new_max - new_min) / (old_max - old_min)
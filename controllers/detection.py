@@ -0,0 +1,364 @@
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import cv2
+
+from controllers.config import DETECTION_TILE_SIZE, DETECTION_TILE_OVERLAP, DETECTION_WORKERS
+from controllers.log import get_logger
+
+logger = get_logger("detection")
+
+# Formato columnar de las estrellas detectadas (little-endian, 16 bytes por estrella)
+STAR_DTYPE = np.dtype([('x', '<i4'), ('y', '<i4'), ('area', '<i4'), ('flux', '<f4')])
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def to_grayscale(image):
+    """
+    Convierte una imagen PIL a un arreglo uint8 de un solo canal.
+    """
+    image_array = np.array(image.convert('RGB'))
+    return cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+
+
+def otsu_threshold(gray_image):
+    """
+    Umbral de Otsu calculado a partir del histograma global (mismo resultado que cv2.THRESH_OTSU).
+    """
+    hist = cv2.calcHist([gray_image], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+    p = hist / hist.sum()
+    levels = np.arange(256, dtype=np.float64)
+    q1 = np.cumsum(p)
+    q2 = 1.0 - q1
+    m1 = np.cumsum(levels * p)
+    mu = m1[-1]
+
+    eps = np.finfo(np.float32).eps
+    valid = (np.minimum(q1, q2) >= eps) & (np.maximum(q1, q2) <= 1.0 - eps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu1 = m1 / q1
+        mu2 = (mu - m1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+    sigma[~valid] = 0.0
+    return int(np.argmax(sigma))
+
+
+def _label_components(gray_image, threshold, min_area, with_labels=False):
+    """
+    Etiqueta los componentes conexos sobre el umbral; devuelve (estrellas, cajas [left, top, width, height]).
+
+    Con with_labels=True también devuelve la imagen de etiquetas (el componente i tiene la etiqueta i + 1
+    solo si min_area=1, porque entonces no se descarta ninguno).
+    """
+    _, thresholded = cv2.threshold(gray_image, threshold, 255, cv2.THRESH_BINARY)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(thresholded, connectivity=8, ltype=cv2.CV_32S)
+    del thresholded
+
+    # Sumar la intensidad solo sobre los píxeles de primer plano (la etiqueta 0 es el fondo)
+    foreground = labels > 0
+    flux = np.bincount(labels[foreground], weights=gray_image[foreground], minlength=count)
+    del foreground
+    if not with_labels:
+        del labels
+
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = areas >= min_area
+
+    stars = np.empty(int(keep.sum()), dtype=STAR_DTYPE)
+    stars['x'] = centroids[1:, 0][keep]  # Se trunca igual que int() en la versión anterior
+    stars['y'] = centroids[1:, 1][keep]
+    stars['area'] = areas[keep]
+    stars['flux'] = flux[1:][keep]
+    if with_labels:
+        return stars, stats[1:, :4][keep], labels
+    return stars, stats[1:, :4][keep]
+
+
+def _edge_pixels(labels):
+    """
+    Un píxel (x, y) del borde de la región por cada componente que lo toca; (-1, -1) para los demás.
+    """
+    height, width = labels.shape
+    xs = np.concatenate([np.arange(width), np.arange(width), np.zeros(height, int), np.full(height, width - 1)])
+    ys = np.concatenate([np.zeros(width, int), np.full(width, height - 1), np.arange(height), np.arange(height)])
+    found, first = np.unique(labels[ys, xs], return_index=True)
+    pixels = np.full((int(labels.max()) + 1, 2), -1, dtype=np.int32)
+    pixels[found, 0] = xs[first]
+    pixels[found, 1] = ys[first]
+    return pixels[1:]
+
+
+def _sort_stars(stars):
+    # Orden total (x, y, área, flujo) para que la ruta por mosaicos y la directa coincidan exactamente
+    return stars[np.lexsort((stars['flux'], stars['area'], stars['y'], stars['x']))]
+
+
+def detect_stars(gray_image, min_area=8):
+    """
+    Detecta las estrellas como componentes conexos sobre el umbral de Otsu.
+
+    Devuelve un arreglo estructurado STAR_DTYPE (x, y, area, flux) ordenado por x;
+    el flujo es la suma de la intensidad en escala de grises de los píxeles de cada estrella.
+    El área se cuenta en píxeles: min_area=8 retiene aproximadamente las mismas estrellas
+    que el antiguo filtro cv2.contourArea >= 3.
+    """
+    stars, _ = _label_components(gray_image, otsu_threshold(gray_image), min_area)
+    return _sort_stars(stars)
+
+
+def _tile_bounds(height, width, tile_size, overlap):
+    """
+    Genera (límites con solapamiento, núcleo sin solapamiento) de cada mosaico como (y0, y1, x0, x1).
+    """
+    for cy0 in range(0, height, tile_size):
+        for cx0 in range(0, width, tile_size):
+            cy1 = min(cy0 + tile_size, height)
+            cx1 = min(cx0 + tile_size, width)
+            bounds = (max(cy0 - overlap, 0), min(cy1 + overlap, height), max(cx0 - overlap, 0), min(cx1 + overlap, width))
+            yield bounds, (cy0, cy1, cx0, cx1)
+
+
+def _clipped_mask(boxes, bounds, shape):
+    """
+    Componentes (cajas en coordenadas globales) que tocan o cruzan un borde interior de la región.
+    """
+    y0, y1, x0, x1 = bounds
+    height, width = shape[:2]
+    left, top = boxes[:, 0], boxes[:, 1]
+    right, bottom = left + boxes[:, 2], top + boxes[:, 3]
+    return (((left <= x0) & (x0 > 0)) | ((top <= y0) & (y0 > 0)) |
+            ((right >= x1) & (x1 < width)) | ((bottom >= y1) & (y1 < height)))
+
+
+def _detect_in_tile(gray_image, bounds, core, threshold, min_area):
+    """
+    Detecta las estrellas de un mosaico y conserva solo las que le pertenecen.
+
+    Una estrella pertenece al mosaico si su centroide cae en el núcleo y no toca un borde interior.
+    Devuelve también los componentes recortados por el mosaico, que se resuelven después, como filas
+    [left, top, width, height, x, y] con la caja y un píxel del componente en coordenadas globales.
+    """
+    y0, y1, x0, x1 = bounds
+    cy0, cy1, cx0, cx1 = core
+
+    tile = gray_image[y0:y1, x0:x1]
+    # min_area=1: un trozo recortado pequeño puede pertenecer a una estrella grande
+    stars, boxes, labels = _label_components(tile, threshold, 1, with_labels=True)
+    pixels = _edge_pixels(labels)  # Todo componente recortado toca el borde del mosaico
+    del tile, labels
+
+    stars['x'] += x0
+    stars['y'] += y0
+    boxes[:, 0] += x0
+    boxes[:, 1] += y0
+    pixels += (x0, y0)
+    clipped = _clipped_mask(boxes, bounds, gray_image.shape)
+
+    owned = (~clipped & (stars['area'] >= min_area) &
+             (stars['x'] >= cx0) & (stars['x'] < cx1) & (stars['y'] >= cy0) & (stars['y'] < cy1))
+    return stars[owned], np.column_stack([boxes, pixels])[clipped]
+
+
+def _resolve_clipped(gray_image, clipped, threshold, min_area, tile_size, overlap):
+    """
+    Recupera las estrellas más grandes que el solapamiento, que ningún mosaico vio completas.
+
+    Cada trozo recortado se vuelve a etiquetar en una región que crece hasta contener completo su
+    componente; de la región se conservan todos los componentes completos que el mosaico dueño de su
+    centroide descartó. Los trozos cuyo píxel cae en uno de esos componentes ya quedan resueltos, así
+    que una estrella enorme repartida en muchos mosaicos se etiqueta una sola vez.
+    """
+    height, width = gray_image.shape[:2]
+    resolved = np.zeros(len(clipped), dtype=bool)
+    found = []
+    for i, (left, top, w, h, px, py) in enumerate(clipped.tolist()):
+        if resolved[i]:
+            continue
+
+        y0, y1, x0, x1 = top, top + h, left, left + w
+        step = max(overlap, 1)
+        while True:
+            stars, boxes, labels = _label_components(gray_image[y0:y1, x0:x1], threshold, 1, with_labels=True)
+            stars['x'] += x0
+            stars['y'] += y0
+            boxes[:, 0] += x0
+            boxes[:, 1] += y0
+            clipped_here = _clipped_mask(boxes, (y0, y1, x0, x1), gray_image.shape)
+            seed = labels[py - y0, px - x0] - 1  # Componente del trozo recortado
+            if not clipped_here[seed]:
+                break
+            # Crecer solo hacia los bordes que toca, con pasos que se duplican para no etiquetar de más
+            sx0, sy0, sw, sh = boxes[seed].tolist()
+            ny0 = max(y0 - step, 0) if sy0 <= y0 else y0
+            nx0 = max(x0 - step, 0) if sx0 <= x0 else x0
+            ny1 = min(y1 + step, height) if sy0 + sh >= y1 else y1
+            nx1 = min(x1 + step, width) if sx0 + sw >= x1 else x1
+            y0, y1, x0, x1 = ny0, ny1, nx0, nx1
+            step *= 2
+
+        # Todos los trozos pendientes que pertenecen a un componente completo de esta región
+        inside = (~resolved & (clipped[:, 4] >= x0) & (clipped[:, 4] < x1) &
+                  (clipped[:, 5] >= y0) & (clipped[:, 5] < y1))
+        resolved[inside] = ~clipped_here[labels[clipped[inside, 5] - y0, clipped[inside, 4] - x0] - 1]
+        del labels
+        stars, boxes = stars[~clipped_here], boxes[~clipped_here]
+
+        # Mosaico dueño de cada centroide y si ese mosaico lo tenía recortado
+        owner_y = stars['y'] // tile_size * tile_size
+        owner_x = stars['x'] // tile_size * tile_size
+        owner_bounds = (np.maximum(owner_y - overlap, 0), np.minimum(owner_y + tile_size + overlap, height),
+                        np.maximum(owner_x - overlap, 0), np.minimum(owner_x + tile_size + overlap, width))
+        dropped = _clipped_mask(boxes, owner_bounds, gray_image.shape)
+        found.append(stars[dropped & (stars['area'] >= min_area)])
+
+    if not found:
+        return np.empty(0, dtype=STAR_DTYPE)
+    # Varias regiones pueden contener la misma estrella completa: mismos píxeles, mismo registro
+    return np.unique(np.concatenate(found))
+
+
+def _detect_shared_tile(shm_name, shape, bounds, core, threshold, min_area):
+    # Se ejecuta en un proceso del pool: la imagen se lee de memoria compartida sin copiarla
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        gray_image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        result = _detect_in_tile(gray_image, bounds, core, threshold, min_area)
+        del gray_image
+        return result
+    finally:
+        shm.close()
+
+
+def _get_pool(workers):
+    """
+    Devuelve el pool de procesos compartido, recreándolo si cambia el número de workers.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn evita heredar el estado de los hilos del servidor Flask en los procesos hijos
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+        _pool_workers = None
+
+
+def _detect_tiles_sequential(gray_image, tiles, threshold, min_area, on_tile, should_cancel):
+    results = []
+    for bounds, core in tiles:
+        if should_cancel is not None and should_cancel():
+            return None
+        results.append(_detect_in_tile(gray_image, bounds, core, threshold, min_area))
+        if on_tile is not None:
+            on_tile(results[-1][0], len(results), len(tiles))
+    return results
+
+
+def _detect_tiles_parallel(gray_image, tiles, threshold, min_area, workers, on_tile, should_cancel):
+    shm = shared_memory.SharedMemory(create=True, size=gray_image.nbytes)
+    try:
+        shared = np.ndarray(gray_image.shape, dtype=np.uint8, buffer=shm.buf)
+        shared[:] = gray_image
+        del shared
+        pool = _get_pool(workers)
+        futures = {pool.submit(_detect_shared_tile, shm.name, gray_image.shape, bounds, core, threshold,
+                               min_area): i for i, (bounds, core) in enumerate(tiles)}
+        # Se combinan en el orden de los mosaicos, no en el de finalización: el resultado es determinista
+        results = [None] * len(tiles)
+        for done, future in enumerate(as_completed(futures), 1):
+            if should_cancel is not None and should_cancel():
+                for pending in futures:
+                    pending.cancel()
+                return None
+            results[futures[future]] = future.result()
+            if on_tile is not None:
+                on_tile(results[futures[future]][0], done, len(tiles))
+        return results
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def detect_stars_tiled(gray_image, min_area=8, tile_size=DETECTION_TILE_SIZE, overlap=DETECTION_TILE_OVERLAP,
+                       workers=DETECTION_WORKERS, on_tile=None, should_cancel=None):
+    """
+    Igual que detect_stars, pero divide la imagen en mosaicos solapados procesados en un pool de procesos.
+
+    El umbral de Otsu se calcula una sola vez sobre el histograma global y las estrellas de las costuras
+    se asignan al mosaico que contiene su centroide, así que el resultado coincide con detect_stars.
+    on_tile(estrellas, terminados, total) se llama con cada mosaico terminado (p. ej. para una vista previa);
+    no incluye las estrellas más grandes que el solapamiento, que solo aparecen en el resultado final.
+    Si should_cancel() devuelve True entre mosaicos, se abandona el resto y se devuelve None.
+    Si el entorno no permite memoria compartida o procesos hijos, los mosaicos se procesan en este proceso.
+    """
+    threshold = otsu_threshold(gray_image)
+    height, width = gray_image.shape[:2]
+    tiles = list(_tile_bounds(height, width, tile_size, overlap))
+
+    if workers > 1 and len(tiles) > 1:
+        try:
+            results = _detect_tiles_parallel(gray_image, tiles, threshold, min_area, workers, on_tile, should_cancel)
+        except (OSError, NotImplementedError, BrokenProcessPool) as e:
+            logger.warning("Sin pool de procesos para la detección (%s); se procesan los mosaicos en serie.", e)
+            _discard_pool()
+            results = _detect_tiles_sequential(gray_image, tiles, threshold, min_area, on_tile, should_cancel)
+    else:
+        results = _detect_tiles_sequential(gray_image, tiles, threshold, min_area, on_tile, should_cancel)
+    if results is None:
+        return None
+
+    parts = [stars for stars, _ in results]
+    clipped = np.concatenate([pieces for _, pieces in results])
+    if len(clipped):
+        parts.append(_resolve_clipped(gray_image, clipped, threshold, min_area, tile_size, overlap))
+    return _sort_stars(np.concatenate(parts))
+
+
+def as_star_array(coords):
+    """
+    Acepta un arreglo STAR_DTYPE o la lista de diccionarios {'x', 'y'} y devuelve un arreglo ordenado por x.
+    """
+    if isinstance(coords, np.ndarray) and coords.dtype == STAR_DTYPE:
+        stars = coords
+    else:
+        stars = np.zeros(len(coords), dtype=STAR_DTYPE)
+        stars['x'] = [coord['x'] for coord in coords]
+        stars['y'] = [coord['y'] for coord in coords]
+    if len(stars) > 1 and np.any(np.diff(stars['x']) < 0):
+        stars = stars[np.argsort(stars['x'], kind='stable')]
+    return stars
+
+
+def stars_to_coords(stars):
+    """
+    Vista compatible con la API anterior: lista de diccionarios {'x', 'y'}.
+    """
+    return [{'x': int(x), 'y': int(y)} for x, y in zip(stars['x'].tolist(), stars['y'].tolist())]
+
+
+def draw_stars(image_array, stars, radius=2, color=(255, 0, 0)):
+    """
+    Marca cada estrella con un punto de color sobre la imagen RGB (en el mismo arreglo).
+    """
+    mask = np.zeros(image_array.shape[:2], dtype=np.uint8)
+    mask[stars['y'], stars['x']] = 1
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+    mask = cv2.dilate(mask, kernel)
+    image_array[mask > 0] = color
+    return image_array
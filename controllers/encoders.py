@@ -0,0 +1,80 @@
+import importlib.util
+
+from controllers.sample_bank import SAMPLE_WIDTH
+from controllers.streaming import wav_header
+
+DEFAULT_AUDIO_FORMAT = "mp3"
+
+
+class EncoderUnavailableError(Exception):
+    """
+    El formato pedido necesita una dependencia que no está instalada.
+    """
+
+
+def encode_wav(pcm, sample_rate, channels, output_filename):
+    """
+    Escribe el buffer de la mezcla directamente como WAV PCM 16 bits (sin procesos externos).
+    """
+    with open(output_filename, "wb") as f:
+        f.write(wav_header(len(pcm), sample_rate, channels))
+        f.write(pcm.tobytes())
+
+
+def encode_flac(pcm, sample_rate, channels, output_filename):
+    """
+    Codifica FLAC dentro del proceso con libsndfile (paquete opcional soundfile).
+    """
+    try:
+        import soundfile
+    except ImportError:
+        raise EncoderUnavailableError("FLAC requiere el paquete soundfile")
+    soundfile.write(output_filename, pcm, sample_rate, subtype="PCM_16", format="FLAC")
+
+
+def _export_with_ffmpeg(pcm, sample_rate, channels, output_filename, audio_format, **kwargs):
+    from pydub import AudioSegment
+
+    segment = AudioSegment(data=pcm.tobytes(), sample_width=SAMPLE_WIDTH, frame_rate=sample_rate, channels=channels)
+    segment.export(output_filename, format=audio_format, **kwargs)
+
+
+def encode_mp3(pcm, sample_rate, channels, output_filename):
+    """
+    Codifica MP3 con ffmpeg a través de pydub (un proceso externo por exportación).
+    """
+    _export_with_ffmpeg(pcm, sample_rate, channels, output_filename, "mp3")
+
+
+def encode_opus(pcm, sample_rate, channels, output_filename):
+    """
+    Codifica Opus (contenedor Ogg) con ffmpeg a través de pydub.
+    """
+    _export_with_ffmpeg(pcm, sample_rate, channels, output_filename, "opus", codec="libopus")
+
+
+# Formatos de salida disponibles: extensión del archivo, tipo MIME y función de codificación
+AUDIO_FORMATS = {
+    "wav": {"extension": "wav", "mimetype": "audio/wav", "encoder": encode_wav},
+    "flac": {"extension": "flac", "mimetype": "audio/flac", "encoder": encode_flac},
+    "mp3": {"extension": "mp3", "mimetype": "audio/mpeg", "encoder": encode_mp3},
+    "opus": {"extension": "opus", "mimetype": "audio/ogg", "encoder": encode_opus},
+}
+
+
+def format_available(audio_format):
+    """
+    Indica si el formato existe y sus dependencias opcionales están instaladas.
+    """
+    if audio_format not in AUDIO_FORMATS:
+        return False
+    if audio_format == "flac":
+        return importlib.util.find_spec("soundfile") is not None
+    return True
+
+
+def encode_audio(pcm, sample_rate, channels, output_filename, audio_format=DEFAULT_AUDIO_FORMAT):
+    """
+    Escribe el buffer int16 (frames, canales) en el formato pedido.
+    """
+    AUDIO_FORMATS[audio_format]["encoder"](pcm, sample_rate, channels, output_filename)
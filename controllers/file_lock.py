@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl  # Bloqueo entre procesos; en Windows no existe y basta con el bloqueo entre hilos
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, thread_lock):
+    """
+    Sección exclusiva tanto entre hilos (thread_lock) como entre procesos (flock sobre el archivo path).
+    """
+    with thread_lock:
+        with open(path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from controllers.config import IMAGE_CACHE_FOLDER, IMAGE_CACHE_MAX_BYTES, IMAGE_DOWNLOAD_MAX_BYTES
+from controllers.file_lock import file_lock
+from controllers.log import get_logger
+from controllers.metrics import timed, cache_result
+
+logger = get_logger("image_cache")
+
+DOWNLOAD_TIMEOUT = (5, 60)  # (conexión, lectura) en segundos
+REVALIDATE_AFTER = 3600  # Segundos antes de volver a preguntar al servidor por una imagen ya guardada
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadTooLargeError(requests.exceptions.RequestException):
+    """
+    La respuesta supera el tamaño máximo de descarga.
+    """
+
+
+def create_session(pool_size=16):
+    """
+    Crea una sesión HTTP con conexiones persistentes (keep-alive) y reintentos.
+    """
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ImageCache:
+    """
+    Caché en disco direccionado por contenido (sha256) para las imágenes descargadas.
+
+    El índice relaciona cada URL con el hash de su contenido y sus cabeceras ETag/Last-Modified;
+    los archivos se eliminan por orden de uso (LRU) cuando se supera el tamaño máximo.
+
+    Varios procesos comparten la carpeta: el índice solo se escribe al descargar o revalidar, bajo un
+    bloqueo de archivo y fusionando lo que ya hay en disco. El orden de uso es la fecha de modificación
+    de cada archivo, así que un acierto no reescribe el índice y la expulsión ve los archivos de todos.
+    """
+
+    def __init__(self, folder=IMAGE_CACHE_FOLDER, max_bytes=IMAGE_CACHE_MAX_BYTES, session=None,
+                 revalidate_after=REVALIDATE_AFTER, max_download=IMAGE_DOWNLOAD_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_download = max_download
+        self.session = session or create_session()
+        self.revalidate_after = revalidate_after
+        self.index_path = os.path.join(folder, "index.json")
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._url_locks = {}
+        self._index = {"urls": {}}
+        self._index_signature = None
+        os.makedirs(os.path.join(folder, "blobs"), exist_ok=True)
+
+    def _read_index(self):
+        """
+        Índice actual; solo se vuelve a leer cuando otro proceso (u otro hilo) lo reemplazó.
+        """
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return self._index
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)  # os.replace cambia el inodo
+        with self._lock:
+            if signature != self._index_signature:
+                try:
+                    with open(self.index_path) as f:
+                        self._index = {"urls": json.load(f).get("urls", {})}
+                    self._index_signature = signature
+                except (OSError, ValueError) as e:
+                    logger.error("No se pudo leer el índice del caché de imágenes: %s", e)
+            return self._index
+
+    def _exclusive(self):
+        return file_lock(os.path.join(self.folder, ".lock"), self._write_lock)
+
+    def _save_index(self, urls):
+        """
+        Escribe el índice; se llama con el bloqueo de archivo tomado y con urls ya fusionadas con el disco.
+        """
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"urls": urls}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, digest):
+        return os.path.join(self.folder, "blobs", digest)
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def lookup(self, url):
+        """
+        Devuelve el hash del contenido guardado para la URL, o None si no está en caché.
+        """
+        entry = self._read_index()["urls"].get(url)
+        if entry and os.path.isfile(self.blob_path(entry["hash"])):
+            return entry["hash"]
+        return None
+
+    def fetch(self, url):
+        """
+        Devuelve (hash, ruta) del contenido de la URL, descargando o revalidando solo si hace falta.
+        """
+        with self._url_lock(url):
+            entry = dict(self._read_index()["urls"].get(url) or {})
+            cached = bool(entry) and os.path.isfile(self.blob_path(entry["hash"]))
+
+            if cached and time.time() - entry.get("checked", 0) < self.revalidate_after:
+                cache_result("image", True)
+                self._touch_blob(entry["hash"])
+                return entry["hash"], self.blob_path(entry["hash"])
+
+            headers = {}
+            if cached:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+            try:
+                with timed("download"):
+                    # stream=True: el cuerpo se escribe a disco por bloques en lugar de quedarse en memoria
+                    response = self.session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True)
+                    with response:
+                        not_modified = response.status_code == 304 and cached
+                        if not not_modified:
+                            response.raise_for_status()
+                            digest = self._store(response)
+            except requests.exceptions.RequestException:
+                if cached:
+                    # Sin red: servir la copia guardada aunque no se haya podido revalidar
+                    logger.warning("No se pudo revalidar %s, usando la copia en caché.", url)
+                    return entry["hash"], self.blob_path(entry["hash"])
+                raise
+
+            if not_modified:
+                cache_result("image", True)
+                self._record(url, entry)
+                return entry["hash"], self.blob_path(entry["hash"])
+
+            cache_result("image", False)
+            entry = {
+                "hash": digest,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            self._record(url, entry)
+            self._evict()
+            return digest, self.blob_path(digest)
+
+    def _store(self, response):
+        """
+        Guarda el cuerpo de la respuesta calculando su hash por bloques; lanza DownloadTooLargeError
+        si supera max_download.
+        """
+        if int(response.headers.get("Content-Length") or 0) > self.max_download:
+            raise DownloadTooLargeError(f"La imagen supera {self.max_download >> 20} MB")
+        sha256 = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.folder, "blobs", f"download.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_download:
+                        raise DownloadTooLargeError(f"La imagen supera {self.max_download >> 20} MB")
+                    sha256.update(chunk)
+                    f.write(chunk)
+            digest = sha256.hexdigest()
+            if os.path.isfile(self.blob_path(digest)):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, self.blob_path(digest))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def _touch_blob(self, digest):
+        """
+        Marca el archivo como usado ahora (su fecha de modificación es el orden LRU).
+        """
+        try:
+            os.utime(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _record(self, url, entry):
+        """
+        Guarda la entrada de la URL recién descargada o revalidada sin perder las de otros procesos.
+        """
+        entry["checked"] = time.time()
+        self._touch_blob(entry["hash"])
+        with self._exclusive():
+            self._index_signature = None  # Releer siempre: otro proceso pudo escribir hace un instante
+            urls = dict(self._read_index()["urls"])
+            urls[url] = entry
+            self._save_index(urls)
+
+    def _evict(self):
+        """
+        Elimina los archivos usados hace más tiempo hasta quedar por debajo del tamaño máximo.
+        """
+        with self._exclusive():
+            blobs = []
+            with os.scandir(os.path.join(self.folder, "blobs")) as entries:
+                for blob in entries:
+                    if not blob.name.endswith(".tmp"):
+                        stat = blob.stat()
+                        blobs.append((stat.st_mtime, stat.st_size, blob.name))
+            total = sum(size for _, size, _ in blobs)
+            if total <= self.max_bytes:
+                return
+            removed = set()
+            for _, size, digest in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed.add(digest)
+            self._index_signature = None
+            urls = self._read_index()["urls"]
+            self._save_index({url: entry for url, entry in urls.items() if entry["hash"] not in removed})
+
+    def prefetch(self, urls):
+        """
+        Descarga (o revalida) todas las URLs; los errores se registran y no interrumpen el resto.
+        """
+        for url in urls:
+            try:
+                self.fetch(url)
+            except requests.exceptions.RequestException as e:
+                logger.error("Error al precargar %s: %s", url, e)
+
+    def start_prefetch(self, urls):
+        """
+        Precarga el catálogo en un hilo en segundo plano.
+        """
+        thread = threading.Thread(target=self.prefetch, args=(list(urls),), daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,97 @@
+import math
+import warnings
+import numpy as np
+from PIL import Image
+
+from controllers.config import DECODE_MAX_PIXELS, DECODE_MEMORY_BUDGET, DECODE_OVERSIZE
+from controllers.detection import STAR_DTYPE
+from controllers.log import get_logger
+
+logger = get_logger("image_decode")
+
+# Bytes por píxel que ocupa cada modo de PIL en memoria (RGB se guarda con 4 bytes por píxel)
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "LA": 4, "La": 4, "PA": 4, "I;16": 2, "I;16B": 2, "I;16L": 2}
+
+
+class ImageTooLargeError(Exception):
+    """
+    La imagen no cabe en el presupuesto de decodificación y no se puede (o no se quiere) reducir.
+    """
+
+
+def _decode_cost(width, height, mode):
+    # Imagen decodificada + su conversión a L + la copia en NumPy
+    return width * height * (MODE_BYTES.get(mode, 4) + 2)
+
+
+def load_grayscale(path, max_pixels=DECODE_MAX_PIXELS, memory_budget=DECODE_MEMORY_BUDGET, oversize=DECODE_OVERSIZE):
+    """
+    Decodifica la imagen directamente a luminancia uint8 sin pasar por una copia RGB en NumPy.
+
+    Los JPEG se decodifican ya en escala de grises (y reducidos 1/2, 1/4 o 1/8 con draft si hace falta);
+    el resto se convierte a L y, si supera max_pixels, se reduce promediando bloques. Con oversize="reject"
+    o si la decodificación no cabe en memory_budget se lanza ImageTooLargeError.
+    Devuelve (arreglo, (ancho, alto) original).
+    """
+    try:
+        with warnings.catch_warnings():
+            # Entre Image.MAX_IMAGE_PIXELS y el doble el aviso de PIL sobra: aquí manda el presupuesto, que se
+            # comprueba con el tamaño del encabezado antes de decodificar. Por encima del doble PIL se niega.
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            image = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    with image:
+        source_size = image.size
+        width, height = source_size
+        factor = 1
+        if width * height > max_pixels:
+            if oversize == "reject":
+                raise ImageTooLargeError(f"La imagen tiene {width}x{height} píxeles; el máximo es {max_pixels}")
+            factor = math.sqrt(width * height / max_pixels)
+
+        if image.format == "JPEG":
+            # El decodificador entrega solo la luminancia y reduce en el dominio DCT: no existe la imagen RGB
+            size = (math.ceil(width / factor), math.ceil(height / factor))
+            if _decode_cost(width, height, "L") > memory_budget and oversize != "reject":
+                # draft solo reduce a 1/2, 1/4 o 1/8 (la mayor escala que no quede por debajo de lo pedido):
+                # sin redondear hacia arriba, un factor de 1.5 decodificaría la imagen completa
+                needed = math.sqrt(_decode_cost(width, height, "L") / memory_budget)
+                scale = min(8, 2 ** math.ceil(math.log2(needed)))
+                if scale >= factor:
+                    size = (max(1, width // scale), max(1, height // scale))
+            image.draft("L", size)
+
+        cost = _decode_cost(*image.size, image.mode)
+        if cost > memory_budget:
+            raise ImageTooLargeError(f"Decodificar la imagen ({width}x{height}, {image.mode}) necesita "
+                                     f"{cost >> 20} MB; el presupuesto es {memory_budget >> 20} MB")
+
+        gray = image.convert("L") if image.mode != "L" else image
+        remaining = math.ceil(math.sqrt(gray.width * gray.height / max_pixels))
+        if remaining > 1:
+            reduced = gray.reduce(remaining)
+            gray.close()
+            gray = reduced
+        if gray.size != source_size:
+            logger.info("Imagen de %dx%d decodificada a %dx%d.", width, height, gray.width, gray.height)
+        array = np.asarray(gray)
+        if gray is not image:
+            gray.close()
+    return array, source_size
+
+
+def to_source_stars(stars, gray_shape, source_size):
+    """
+    Lleva las estrellas detectadas en una imagen reducida a las coordenadas (y escala de área y flujo) del original.
+    """
+    scale_x = source_size[0] / gray_shape[1]
+    scale_y = source_size[1] / gray_shape[0]
+    if scale_x == 1 and scale_y == 1:
+        return stars
+    scaled = np.empty(len(stars), dtype=STAR_DTYPE)
+    scaled['x'] = np.minimum((stars['x'] + 0.5) * scale_x, source_size[0] - 1)
+    scaled['y'] = np.minimum((stars['y'] + 0.5) * scale_y, source_size[1] - 1)
+    scaled['area'] = np.round(stars['area'] * scale_x * scale_y)
+    scaled['flux'] = stars['flux'] * scale_x * scale_y
+    return scaled
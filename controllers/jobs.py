@@ -0,0 +1,314 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from controllers.config import RENDER_WORKERS, RENDER_QUEUE_LIMIT, JOBS_OUTPUT_FOLDER, JOB_TTL
+from controllers.streaming import AudioStream
+from controllers.log import get_logger
+from controllers.metrics import STAGE_SECONDS, JOBS_FINISHED, timed, profiling
+
+logger = get_logger("jobs")
+
+
+class QueueFullError(Exception):
+    """
+    La cola de renderizado está llena; el cliente debe reintentar más tarde.
+    """
+
+
+class Render:
+    """
+    Un renderizado del pool con su propio archivo de salida y su propia señal de cancelación.
+
+    Lo comparten todos los trabajos idénticos que llegan mientras está activo (singleflight); solo se
+    cancela cuando lo cancelan todos los trabajos suscritos.
+    """
+
+    def __init__(self, render_id, output_path, stream=None, profile=None, dedupe_key=None):
+        self.id = render_id
+        self.output_path = output_path
+        self.stream = stream  # AudioStream si el cliente pidió recibir el audio mientras se genera
+        self.cached = False
+        self.dedupe_key = dedupe_key
+        self.profile = profile  # Diccionario etapa -> segundos si el cliente pidió el desglose de tiempos
+        self.status = "queued"  # queued -> running -> done | error | cancelled
+        self.progress = 0.0
+        self.message = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.jobs = []
+        self.subscribers = 0  # Trabajos suscritos que no se han cancelado
+        self._lock = threading.Lock()
+
+    def update_progress(self, progress):
+        self.progress = round(float(progress), 1)
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def subscribe(self, job):
+        """
+        Suma un trabajo a este renderizado; False si ya terminó o se está cancelando.
+        """
+        with self._lock:
+            if not self.active or self.is_cancelled():
+                return False
+            self.jobs.append(job)
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self, job):
+        """
+        Cancela solo el trabajo dado; el renderizado se cancela cuando ya no le queda ninguno.
+        """
+        with self._lock:
+            if job.cancelled is not None or not self.active:
+                return
+            job.cancelled = time.time()
+            self.subscribers -= 1
+            last = self.subscribers == 0
+        job.finished_event.set()
+        if last:
+            self.cancel()
+
+    def cancel(self):
+        self.cancel_event.set()
+        with self._lock:
+            if self.status != "queued":
+                return
+            self.status = "cancelled"
+        self.finish()  # Sin esperar a que un hilo del pool lo saque de la cola
+
+    def start(self):
+        """
+        Pasa a running al salir de la cola; False si se canceló mientras esperaba.
+        """
+        with self._lock:
+            if self.is_cancelled():
+                return False
+            self.status = "running"
+            self.started = time.time()
+            return True
+
+    def finish(self):
+        if self.stream is not None:
+            self.stream.close()
+        self.finished = time.time()
+        with self._lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.finished_event.set()
+
+
+class Job:
+    """
+    Lo que ve cada cliente: un id, sus parámetros y su propia cancelación sobre un Render que puede
+    compartir con otros trabajos idénticos. El estado, el progreso y el audio son los del Render.
+    """
+
+    def __init__(self, job_id, render, params=None):
+        self.id = job_id
+        self.render = render
+        self.params = params or {}
+        self.created = time.time()
+        self.cancelled = None  # Momento en que este cliente canceló
+        self.finished_event = threading.Event()  # Se activa cuando el trabajo deja de estar activo
+
+    def cancel(self):
+        self.render.unsubscribe(self)
+
+    @property
+    def status(self):
+        return "cancelled" if self.cancelled is not None else self.render.status
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    @property
+    def finished(self):
+        return self.cancelled if self.cancelled is not None else self.render.finished
+
+    @property
+    def progress(self):
+        return self.render.progress
+
+    @property
+    def message(self):
+        return self.render.message
+
+    @property
+    def started(self):
+        return self.render.started
+
+    @property
+    def output_path(self):
+        return self.render.output_path
+
+    @property
+    def stream(self):
+        return self.render.stream
+
+    @property
+    def cached(self):
+        return self.render.cached
+
+    @property
+    def profile(self):
+        return self.render.profile
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'params': self.params,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'streaming': self.stream is not None,
+            'cached': self.cached,
+            'profile': self.profile,
+        }
+
+
+class JobManager:
+    """
+    Pool acotado de hilos de renderizado con límite de cola (backpressure).
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, queue_limit=RENDER_QUEUE_LIMIT, output_folder=JOBS_OUTPUT_FOLDER,
+                 ttl=JOB_TTL):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.output_folder = output_folder
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="render")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(output_folder, exist_ok=True)
+
+    def _active_renders(self):
+        return {job.render for job in self._jobs.values() if job.render.active}
+
+    def queue_depth(self):
+        """
+        Renderizados en cola o en ejecución.
+        """
+        with self._lock:
+            return len(self._active_renders())
+
+    def submit(self, target, params=None, extension="mp3", stream=False, dedupe_key=None, profile=None):
+        """
+        Encola target(render) y devuelve el Job; lanza QueueFullError si no hay espacio.
+
+        Con stream=True el renderizado también escribe un WAV progresivo en render.stream.
+        Si ya hay un renderizado activo con el mismo dedupe_key, el trabajo nuevo se suscribe a él
+        (singleflight) con su propio id: cancelarlo no afecta a los demás clientes.
+        Si se pasa un diccionario profile, el renderizado acumula en él el tiempo de cada etapa.
+        """
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if dedupe_key is not None:
+                for other in self._active_renders():
+                    if other.dedupe_key == dedupe_key and (not stream or other.stream is not None) and \
+                            (profile is None or other.profile is not None):
+                        job = Job(job_id, other, params)
+                        if other.subscribe(job):
+                            self._jobs[job_id] = job
+                            return job
+            active = len(self._active_renders())
+            if active >= self.workers + self.queue_limit:
+                raise QueueFullError(f"Hay {active} trabajos pendientes")
+            audio_stream = AudioStream(os.path.join(self.output_folder, f"{job_id}.stream.wav")) if stream else None
+            render = Render(job_id, os.path.join(self.output_folder, f"{job_id}.{extension}"), audio_stream, profile,
+                            dedupe_key)
+            job = Job(job_id, render, params)
+            render.subscribe(job)
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, render, target)
+        return job
+
+    def add_completed(self, fill, params=None, extension="mp3", profile=None):
+        """
+        Registra un trabajo ya terminado cuyo audio vino del caché de resultados.
+
+        fill(ruta) escribe el audio en el archivo de salida del trabajo; si devuelve False (el audio ya
+        no está en el caché) no se registra nada y se devuelve None.
+        """
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        render = Render(job_id, os.path.join(self.output_folder, f"{job_id}.{extension}"), profile=profile)
+        if not fill(render.output_path):
+            return None
+        render.cached = True
+        render.status = "done"
+        render.progress = 100.0
+        render.started = render.finished = render.created
+        job = Job(job_id, render, params)
+        job.finished_event.set()
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def _run(self, render, target):
+        if not render.start():
+            return
+        STAGE_SECONDS.observe(render.started - render.created, stage="queue_wait")
+        if render.profile is not None:
+            render.profile["queue_wait"] = round(render.started - render.created, 6)
+        try:
+            with profiling(render.profile), timed("render"):
+                target(render)
+            if render.is_cancelled():
+                render.status = "cancelled"
+            elif render.status == "running":
+                render.status = "done"
+                render.progress = 100.0
+        except Exception as e:
+            logger.error("Error en el trabajo %s: %s", render.id, e)
+            render.status = "error"
+            render.message = str(e)
+        finally:
+            render.finish()
+            JOBS_FINISHED.inc(status=render.status)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _purge_expired(self):
+        """
+        Olvida los trabajos terminados hace más de ttl segundos y borra los archivos de los renderizados
+        que ya no usa ningún trabajo.
+        """
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job.finished and now - job.finished > self.ttl]
+            for job in expired:
+                del self._jobs[job.id]
+            in_use = {job.render for job in self._jobs.values()}
+            orphaned = {job.render for job in expired if not job.render.active} - in_use
+        for render in orphaned:
+            try:
+                os.remove(render.output_path)
+            except FileNotFoundError:
+                pass
+            if render.stream is not None:
+                render.stream.remove()
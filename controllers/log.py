@@ -0,0 +1,60 @@
+import time
+import logging
+import threading
+
+from controllers.config import LOG_LEVEL, LOG_RATE_LIMIT, LOG_RATE_PERIOD
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Deja pasar como máximo limit registros con el mismo mensaje cada period segundos.
+
+    Los mensajes se agrupan por su plantilla (antes de formatear los argumentos); los descartados
+    se cuentan y se informan en el primer registro que vuelve a pasar.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, period=LOG_RATE_PERIOD):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        self._windows = {}  # (logger, plantilla) -> [inicio de la ventana, emitidos, descartados]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} mensajes iguales omitidos)"
+            if window[1] >= self.limit:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+def get_logger(name):
+    """
+    Devuelve el logger polaris.<name>; la primera llamada configura el nivel, el formato y el límite de frecuencia.
+    """
+    global _configured
+    with _configure_lock:
+        if not _configured:
+            root = logging.getLogger("polaris")
+            root.setLevel(LOG_LEVEL)
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+            handler.addFilter(RateLimitFilter())
+            root.addHandler(handler)
+            root.propagate = False
+            _configured = True
+    return logging.getLogger(f"polaris.{name}")
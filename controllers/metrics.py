@@ -0,0 +1,164 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Límites (en segundos) de los histogramas de duración por etapa
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_metrics = []
+_local = threading.local()
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Contador acumulativo, opcionalmente con etiquetas.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """
+    Valor instantáneo que se calcula al exportar las métricas.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        _metrics.append(self)
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, "", self.function()
+
+
+class Histogram:
+    """
+    Distribución de observaciones en cubetas acumulativas, como los histogramas de Prometheus.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._values = {}  # etiquetas -> [conteos por cubeta, suma, total]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), \
+                    bucket_count
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+STAGE_SECONDS = Histogram("polaris_stage_seconds", "Duración de cada etapa del pipeline en segundos", ("stage",))
+STARS_DETECTED = Counter("polaris_stars_detected_total", "Estrellas detectadas en imágenes decodificadas")
+NOTES_MIXED = Counter("polaris_notes_mixed_total", "Notas superpuestas en audios generados")
+CACHE_REQUESTS = Counter("polaris_cache_requests_total", "Consultas a los cachés por resultado", ("cache", "result"))
+JOBS_FINISHED = Counter("polaris_jobs_finished_total", "Trabajos de renderizado terminados por estado", ("status",))
+QUEUE_DEPTH = Gauge("polaris_queue_depth", "Trabajos de renderizado en cola o en ejecución")
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def profiling(profile):
+    """
+    Acumula en el diccionario profile los tiempos de las etapas ejecutadas en este hilo.
+    """
+    previous = getattr(_local, "profile", None)
+    _local.profile = profile
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+
+
+@contextmanager
+def timed(stage):
+    """
+    Mide el bloque, lo registra en el histograma de la etapa y en el perfil activo del hilo (si lo hay).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        profile = getattr(_local, "profile", None)
+        if profile is not None:
+            profile[stage] = round(profile.get(stage, 0) + elapsed, 6)
+
+
+def render_metrics():
+    """
+    Todas las métricas en el formato de texto de Prometheus.
+    """
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
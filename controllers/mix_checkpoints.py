@@ -0,0 +1,156 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from controllers.config import MIX_CHECKPOINT_MAX_BYTES, MIX_CHECKPOINT_SPACING, MIX_CHECKPOINT_MAX
+from controllers.mixer import PROGRESS_STEPS, ms_to_frames, mix_notes, _note_pcm
+
+
+class MixState:
+    """
+    La mezcla más larga hecha hasta ahora para una imagen e intervalo.
+
+    final guarda los frames ya definitivos (anteriores al inicio de la siguiente nota) y cada punto de
+    control n guarda la cola int32 que las notas 0..n-1 dejan a partir del inicio de la nota n.
+    Nunca se modifica después de guardarse; una mezcla nueva crea otro MixState.
+    """
+
+    def __init__(self, names, gains, final, checkpoints):
+        self.names = names
+        self.gains = gains
+        self.final = final
+        self.checkpoints = checkpoints
+
+    @property
+    def nbytes(self):
+        return self.final.nbytes + sum(tail.nbytes for tail in self.checkpoints.values())
+
+    def common_prefix(self, plan):
+        """
+        Cuántas notas iniciales del plan coinciden (nota y ganancias) con las ya mezcladas.
+        """
+        count = min(len(self.names), len(plan))
+        same = self.names[:count] == np.asarray(plan.names[:count])
+        if (self.gains is None) != (plan.gains is None):
+            return 0
+        if self.gains is not None:
+            same &= (self.gains[:count] == plan.gains[:count]).all(axis=1)
+        return count if same.all() else int(np.argmin(same))
+
+
+class MixCheckpoints:
+    """
+    Caché en memoria de MixState por clave, con presupuesto de bytes y expulsión LRU.
+    """
+
+    def __init__(self, max_bytes=MIX_CHECKPOINT_MAX_BYTES, spacing=MIX_CHECKPOINT_SPACING,
+                 max_checkpoints=MIX_CHECKPOINT_MAX):
+        self.max_bytes = max_bytes
+        self.spacing = spacing
+        self.max_checkpoints = max_checkpoints
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+            return state
+
+    def put(self, key, state):
+        if state.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            total = sum(other.nbytes for other in self._states.values())
+            while total > self.max_bytes:
+                _, evicted = self._states.popitem(last=False)
+                total -= evicted.nbytes
+
+    def thin(self, checkpoints, last):
+        """
+        Deja como máximo max_checkpoints puntos, espaciados en potencias de dos, más el inicio y el final.
+        """
+        spacing = self.spacing
+        while last // spacing > self.max_checkpoints:
+            spacing *= 2
+        return {n: tail for n, tail in checkpoints.items() if n == 0 or n == last or n % spacing == 0}
+
+
+def mix_incremental(plan, bank, interval_between_starts, store, key, update_progress=None, should_cancel=None):
+    """
+    Igual que mix_notes, pero reutiliza la mezcla anterior de la misma clave.
+
+    Si las primeras notas del plan coinciden con una mezcla previa (p. ej. solo cambió maxStars), se
+    parte del punto de control más cercano y solo se suman las notas restantes, tanto al agregar
+    estrellas como al quitarlas. Devuelve (pcm int16, notas reutilizadas), o (None, 0) si se canceló.
+    Si la parte definitiva de la mezcla no cabe en el presupuesto del caché no se guarda nada nuevo y,
+    sin mezcla previa que aprovechar, se usa directamente mix_notes.
+    """
+    key = (key, id(bank))
+    total_notes = len(plan)
+    total_frames = plan.total_frames
+
+    def start_frame(k):
+        return int(ms_to_frames(k * interval_between_starts, bank.sample_rate))
+
+    state = store.get(key)
+    common = state.common_prefix(plan) if state is not None else 0
+    resume = 0
+    tail = np.zeros((0, bank.channels), dtype=np.int32)
+    if state is not None:
+        resume = max(n for n in state.checkpoints if n <= common)
+        tail = state.checkpoints[resume]
+
+    # Lo definitivo (int16 hasta el inicio de la nota siguiente) es casi todo el tamaño del MixState
+    keep = (state is None or total_notes > common) and \
+        start_frame(total_notes) * bank.channels * 2 <= store.max_bytes
+    if state is None and not keep:
+        return mix_notes(plan, bank, update_progress, should_cancel), 0
+
+    base = min(start_frame(resume), total_frames)
+    pcm = np.empty((total_frames, bank.channels), dtype=np.int16)
+    if base:
+        pcm[:base] = state.final[:base]
+    work = np.zeros((total_frames - base, bank.channels), dtype=np.int32)
+    overlap = min(len(tail), len(work))
+    work[:overlap] += tail[:overlap]
+
+    checkpoints = {}
+    end = base + len(tail)  # Último frame alcanzado por las notas ya sumadas
+    step = max(1, (total_notes - resume) // PROGRESS_STEPS)
+
+    for i in range(resume, total_notes):
+        if (i - resume) % step == 0:
+            if should_cancel is not None and should_cancel():
+                return None, 0
+            if update_progress is not None:
+                update_progress(i / total_notes * 100)
+        start = int(plan.starts[i])
+        if keep and i > common and i % store.spacing == 0:
+            checkpoints[i] = work[start - base:max(end, start) - base].copy()
+        note = _note_pcm(plan, bank, i, plan.names[i])
+        work[start - base:start - base + len(note)] += note
+        end = max(end, start + len(note))
+
+    if keep:
+        # La cola se guarda sin recortar: las notas que se sumen después pueden volver a bajarla del límite
+        last_start = start_frame(total_notes)
+        checkpoints[total_notes] = work[min(last_start, total_frames) - base:max(end, last_start) - base].copy()
+
+    np.clip(work, -32768, 32767, out=work)
+    pcm[base:] = work
+
+    if keep:
+        # Guardar lo definitivo hasta el inicio de la nota siguiente y la cola que queda después
+        final = np.zeros((last_start, bank.channels), dtype=np.int16)
+        final[:min(last_start, total_frames)] = pcm[:last_start]
+        if state is not None:
+            checkpoints.update({n: tail for n, tail in state.checkpoints.items() if n <= common})
+        checkpoints.setdefault(0, np.zeros((0, bank.channels), dtype=np.int32))
+        store.put(key, MixState(np.asarray(plan.names), plan.gains, final,
+                                store.thin(checkpoints, total_notes)))
+
+    return pcm, resume
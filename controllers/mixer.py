@@ -0,0 +1,148 @@
+import numpy as np
+
+from controllers.sample_bank import SAMPLE_WIDTH
+
+MIN_AUDIO_DURATION = 10000  # 10 segundos en milisegundos
+TAIL_DURATION = 1000  # Extra 1000ms para seguridad
+PROGRESS_STEPS = 100  # Número máximo de llamadas a update_progress por mezcla
+STREAM_CHUNK_FRAMES = 11025  # Bloques de 0.25 s a 44.1 kHz al transmitir
+
+
+class MixPlan:
+    """
+    Posición (en frames) de cada nota dentro de la pista final.
+
+    gains, si existe, es un arreglo (notas, canales) con la ganancia de cada nota en cada canal.
+    """
+
+    def __init__(self, names, starts, lengths, total_frames, gains=None):
+        self.names = names
+        self.starts = starts
+        self.lengths = lengths
+        self.total_frames = total_frames
+        self.gains = gains
+
+    def __len__(self):
+        return len(self.names)
+
+
+def ms_to_frames(ms, sample_rate):
+    """
+    Convierte milisegundos a frames igual que pydub al recortar/superponer (truncando).
+    """
+    return np.asarray(ms, dtype=np.int64) * sample_rate // 1000
+
+
+def plan_mix(note_numbers, bank, interval_between_starts, gains=None):
+    """
+    Calcula dónde empieza cada nota: la k-ésima nota encontrada suena en k * intervalo.
+
+    Las notas que no existen en el banco se omiten sin avanzar el tiempo, como antes.
+    gains (opcional) tiene una fila de ganancias por canal para cada número de nota.
+    """
+    names = [str(int(number)) for number in note_numbers]
+    found = np.array([name in bank for name in names], dtype=bool)
+    names = [name for name, keep in zip(names, found) if keep]
+    if gains is not None:
+        gains = np.asarray(gains, dtype=np.float32)[found]
+
+    starts = ms_to_frames(np.arange(len(names), dtype=np.int64) * interval_between_starts, bank.sample_rate)
+    lengths = np.array([bank.index[name][1] for name in names], dtype=np.int64)
+
+    total_duration = max((len(note_numbers) - 1) * interval_between_starts + TAIL_DURATION, MIN_AUDIO_DURATION)
+    total_frames = int(ms_to_frames(total_duration, bank.sample_rate))
+    if len(names):
+        total_frames = max(total_frames, int((starts + lengths).max()))
+
+    return MixPlan(names, starts, lengths, total_frames, gains)
+
+
+def _note_pcm(plan, bank, i, name):
+    pcm = bank.get(name)
+    if plan.gains is None:
+        return pcm
+    return (pcm * plan.gains[i]).astype(np.int32)
+
+
+def mix_notes(plan, bank, update_progress=None, should_cancel=None):
+    """
+    Suma todas las notas del plan en un único acumulador y recorta a int16 al final.
+
+    Devuelve un arreglo (frames, canales) int16, o None si se canceló.
+    """
+    accumulator = np.zeros((plan.total_frames, bank.channels), dtype=np.int32)
+    total = len(plan)
+    step = max(1, total // PROGRESS_STEPS)
+
+    for i, (name, start) in enumerate(zip(plan.names, plan.starts)):
+        if i % step == 0:
+            if should_cancel is not None and should_cancel():
+                return None
+            if update_progress is not None:
+                update_progress(i / total * 100)
+        pcm = _note_pcm(plan, bank, i, name)
+        accumulator[start:start + len(pcm)] += pcm
+
+    np.clip(accumulator, -32768, 32767, out=accumulator)
+    return accumulator.astype(np.int16)
+
+
+def to_audio_segment(pcm, sample_rate, channels):
+    """
+    Envuelve el resultado de la mezcla en un AudioSegment de pydub para exportarlo.
+    """
+    from pydub import AudioSegment
+
+    return AudioSegment(data=pcm.tobytes(), sample_width=SAMPLE_WIDTH, frame_rate=sample_rate, channels=channels)
+
+
+def iter_mix_chunks(plan, bank, chunk_frames=STREAM_CHUNK_FRAMES, update_progress=None, should_cancel=None):
+    """
+    Igual que mix_notes, pero entrega la pista en bloques int16 en orden temporal.
+
+    Como las notas empiezan en orden, todo lo anterior al inicio de la siguiente nota ya es definitivo
+    y se puede entregar; solo se mantiene en memoria una ventana del tamaño de la nota más larga.
+    Si se cancela, el generador termina antes de cubrir plan.total_frames.
+    """
+    longest = int(plan.lengths.max()) if len(plan) else 0
+    buffer = np.zeros((2 * (longest + chunk_frames), bank.channels), dtype=np.int32)
+    head = 0  # Posición en buffer del primer frame aún no entregado
+    emitted = 0
+    total = len(plan)
+    step = max(1, total // PROGRESS_STEPS)
+
+    def compact():
+        # Mover la parte pendiente al inicio del buffer; nunca ocupa más de la mitad
+        nonlocal head
+        pending = buffer[head:].copy()
+        buffer[:] = 0
+        buffer[:len(pending)] = pending
+        head = 0
+
+    def take(count):
+        nonlocal head, emitted
+        if head + count > len(buffer):
+            compact()
+        chunk = np.clip(buffer[head:head + count], -32768, 32767).astype(np.int16)
+        head += count
+        emitted += count
+        return chunk
+
+    for i, (name, start) in enumerate(zip(plan.names, plan.starts)):
+        if i % step == 0:
+            if should_cancel is not None and should_cancel():
+                return
+            if update_progress is not None:
+                update_progress(i / total * 100)
+
+        while start - emitted >= chunk_frames:
+            yield take(chunk_frames)
+
+        pcm = _note_pcm(plan, bank, i, name)
+        if head + (start - emitted) + len(pcm) > len(buffer):
+            compact()
+        offset = head + (start - emitted)
+        buffer[offset:offset + len(pcm)] += pcm
+
+    while emitted < plan.total_frames:
+        yield take(min(chunk_frames, plan.total_frames - emitted))
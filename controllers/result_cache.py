@@ -0,0 +1,90 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from controllers.config import RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES
+from controllers.file_lock import file_lock
+
+
+def result_key(image_hash, params):
+    """
+    Clave del audio renderizado: hash de la imagen más todos los parámetros de renderizado.
+    """
+    payload = json.dumps({'image': image_hash, **params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Caché en disco de audios ya codificados, con presupuesto de tamaño y expulsión LRU.
+
+    No hay índice: el orden de uso es la fecha de modificación de cada archivo y la expulsión lista la
+    carpeta bajo un bloqueo de archivo, así que varios procesos comparten el caché y el presupuesto.
+    """
+
+    def __init__(self, folder=RESULT_CACHE_FOLDER, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def copy_to(self, key, extension, output_path):
+        """
+        Pone el audio guardado en output_path (y lo marca como usado); False si no existe.
+
+        El trabajo recibe su propio archivo (un enlace duro si es posible), así que la expulsión del
+        caché no borra un audio que todavía se está descargando.
+        """
+        path = self._path(f"{key}.{extension}")
+        try:
+            try:
+                # Enlace duro si es posible (mismo disco): sin copiar bytes
+                os.link(path, output_path)
+            except FileNotFoundError:
+                return False
+            except OSError:
+                shutil.copyfile(path, output_path)
+            os.utime(path)
+        except FileNotFoundError:
+            # Otro proceso lo expulsó en este instante
+            return False
+        return True
+
+    def put(self, key, extension, source_path):
+        """
+        Guarda una copia del archivo generado y devuelve su ruta dentro del caché.
+        """
+        name = f"{key}.{extension}"
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Enlace duro si es posible (mismo disco): sin copiar bytes
+            os.link(source_path, tmp_path)
+        except OSError:
+            shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        with file_lock(self._path(".lock"), self._lock):
+            files = []
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if not entry.name.startswith(".") and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._path(name))
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,313 @@
+import os
+import mmap
+import json
+import struct
+import hashlib
+import argparse
+import threading
+import numpy as np
+
+from controllers.config import CACHE_FOLDER, SAMPLE_ARTIFACT
+from controllers.asset_store import get_asset_store
+from controllers.log import get_logger
+from controllers.metrics import timed
+
+# Formato común al que se decodifican todas las notas
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2  # bytes por muestra (int16)
+
+# Artefacto precompilado: firma, longitud de la cabecera JSON, cabecera y PCM alineado a página
+ARTIFACT_MAGIC = b"POLARIS1"
+ARTIFACT_ALIGNMENT = 4096
+
+logger = get_logger("sample_bank")
+
+_banks = {}
+_banks_lock = threading.Lock()
+
+
+class SampleBank:
+    """
+    Banco de notas decodificadas a PCM int16 con formato fijo.
+
+    Todas las notas viven en un único arreglo (memmap) de forma (frames, canales);
+    el índice guarda el rango de frames de cada nota por nombre ("25", "cut_25", ...).
+    fingerprint identifica las notas de origen (None si el banco está incompleto); forma parte de la
+    clave de los audios guardados en el caché de resultados.
+    """
+
+    def __init__(self, data, index, sample_rate=SAMPLE_RATE, channels=CHANNELS, fingerprint=None):
+        self.data = data
+        self.index = index
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.fingerprint = fingerprint
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index)
+
+    def get(self, name):
+        """
+        Devuelve la vista PCM (frames, canales) de una nota, o None si no existe.
+        """
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        start, length = entry
+        return self.data[start:start + length]
+
+    def note(self, number, cut=False):
+        """
+        Devuelve la nota con el número dado (o su variante cut_).
+        """
+        return self.get(f"cut_{number}" if cut else str(number))
+
+    def to_audio_segment(self, name):
+        """
+        Convierte una nota a AudioSegment, para el código que aún trabaja con pydub.
+        """
+        from pydub import AudioSegment
+
+        pcm = self.get(name)
+        if pcm is None:
+            return None
+        return AudioSegment(data=np.ascontiguousarray(pcm).tobytes(), sample_width=SAMPLE_WIDTH,
+                            frame_rate=self.sample_rate, channels=self.channels)
+
+
+def _list_note_files(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f for f in os.listdir(folder) if f.lower().endswith(".mp3"))
+
+
+def _fingerprint(folder, files, sample_rate, channels):
+    """
+    Huella de la carpeta de notas: cambia si se agrega, borra o modifica algún archivo.
+    """
+    digest = hashlib.sha1(f"{sample_rate}:{channels}".encode())
+    for name in files:
+        stat = os.stat(os.path.join(folder, name))
+        digest.update(f"{name}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _content_fingerprint(folder, files, sample_rate, channels):
+    """
+    Como _fingerprint pero sin fechas, que cambian al copiar el proyecto a otra máquina.
+    """
+    digest = hashlib.sha1(f"{sample_rate}:{channels}".encode())
+    for name in files:
+        digest.update(f"{name}:{os.path.getsize(os.path.join(folder, name))}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _decode_note(path, sample_rate, channels):
+    # libsndfile (soundfile >= 0.12) lee MP3 sin ffmpeg, que no está en la imagen de build del deploy
+    try:
+        import soundfile
+
+        pcm, rate = soundfile.read(path, dtype="int16", always_2d=True)
+    except (ImportError, RuntimeError):
+        rate = None
+    if rate == sample_rate and pcm.shape[1] in (1, channels):
+        return np.ascontiguousarray(np.broadcast_to(pcm, (len(pcm), channels)))
+
+    from pydub import AudioSegment
+
+    sound = AudioSegment.from_mp3(path)
+    sound = sound.set_frame_rate(sample_rate).set_channels(channels).set_sample_width(SAMPLE_WIDTH)
+    return np.frombuffer(sound.raw_data, dtype=np.int16).reshape(-1, channels)
+
+
+def _decode_all(folder, files, sample_rate, channels):
+    """
+    Decodifica todas las notas en un único arreglo; indica si alguna falló.
+    """
+    pcm_list = []
+    index = {}
+    offset = 0
+    complete = True
+    for name in files:
+        try:
+            pcm = _decode_note(os.path.join(folder, name), sample_rate, channels)
+        except Exception as e:
+            logger.error("Error al decodificar %s: %s", name, e)
+            complete = False
+            continue
+        index[os.path.splitext(name)[0]] = (offset, len(pcm))
+        pcm_list.append(pcm)
+        offset += len(pcm)
+
+    data = np.concatenate(pcm_list) if pcm_list else np.zeros((0, channels), dtype=np.int16)
+    return data, index, complete
+
+
+def _write_cache(data, index, data_path, index_path, sample_rate, channels):
+    """
+    Guarda el banco como .npy + índice .json.
+    """
+    # Escribir en archivos temporales y renombrar para que otro proceso nunca lea un caché a medias
+    tmp_suffix = f".{os.getpid()}.tmp"
+    with open(data_path + tmp_suffix, "wb") as f:
+        np.save(f, data)
+    with open(index_path + tmp_suffix, "w") as f:
+        json.dump({"sample_rate": sample_rate, "channels": channels, "notes": index}, f)
+    os.replace(data_path + tmp_suffix, data_path)
+    os.replace(index_path + tmp_suffix, index_path)
+
+
+def load_sample_bank(folder, cache_folder=CACHE_FOLDER, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Carga el banco de notas de una carpeta, decodificando solo si el caché en disco no existe.
+    """
+    files = _list_note_files(folder)
+    if not files:
+        logger.warning("No se encontraron notas en %s.", folder)
+        return SampleBank(np.zeros((0, channels), dtype=np.int16), {}, sample_rate, channels)
+
+    fingerprint = _fingerprint(folder, files, sample_rate, channels)
+    data_path = os.path.join(cache_folder, f"samples-{fingerprint}.npy")
+    index_path = os.path.join(cache_folder, f"samples-{fingerprint}.json")
+
+    if not (os.path.isfile(data_path) and os.path.isfile(index_path)):
+        logger.info("Decodificando %d notas de %s...", len(files), folder)
+        with timed("decode_notes"):
+            data, index, complete = _decode_all(folder, files, sample_rate, channels)
+        if not complete:
+            # No persistir un banco incompleto: el próximo arranque volverá a intentarlo
+            return SampleBank(data, index, sample_rate, channels)
+        try:
+            os.makedirs(cache_folder, exist_ok=True)
+            _write_cache(data, index, data_path, index_path, sample_rate, channels)
+        except OSError as e:
+            logger.error("No se pudo guardar el caché de notas: %s", e)
+            return SampleBank(data, index, sample_rate, channels, fingerprint)
+
+    data = np.load(data_path, mmap_mode="r")
+    with open(index_path) as f:
+        meta = json.load(f)
+    index = {name: tuple(entry) for name, entry in meta["notes"].items()}
+    return SampleBank(data, index, meta["sample_rate"], meta["channels"], fingerprint)
+
+
+def build_sample_artifact(folder, output_path=SAMPLE_ARTIFACT, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Decodifica todas las notas de la carpeta en un único archivo que load_sample_artifact mapea de una vez.
+    """
+    files = _list_note_files(folder)
+    if not files:
+        raise RuntimeError(f"No se encontraron notas en {folder}")
+    data, index, complete = _decode_all(folder, files, sample_rate, channels)
+    if not complete:
+        raise RuntimeError(f"No se pudieron decodificar todas las notas de {folder}")
+
+    header = json.dumps({
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "frames": len(data),
+        "fingerprint": _content_fingerprint(folder, files, sample_rate, channels),
+        "notes": index,
+    }).encode()
+    prefix = ARTIFACT_MAGIC + struct.pack("<I", len(header)) + header
+    data_offset = -(-len(prefix) // ARTIFACT_ALIGNMENT) * ARTIFACT_ALIGNMENT
+
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        f.write(b"\0" * (data_offset - len(prefix)))
+        f.write(np.ascontiguousarray(data, dtype=np.int16).tobytes())
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def load_sample_artifact(path, folder=None):
+    """
+    Mapea el artefacto en memoria; devuelve None si no es válido o no corresponde a las notas de folder.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+        logger.warning("%s no es un banco de notas precompilado.", path)
+        return None
+    header_start = len(ARTIFACT_MAGIC) + 4
+    (header_length,) = struct.unpack("<I", buffer[len(ARTIFACT_MAGIC):header_start])
+    meta = json.loads(buffer[header_start:header_start + header_length])
+
+    # Si las notas originales están presentes, el artefacto debe haberse generado a partir de ellas
+    files = _list_note_files(folder) if folder else []
+    if files and _content_fingerprint(folder, files, meta["sample_rate"], meta["channels"]) != meta["fingerprint"]:
+        logger.warning("%s no corresponde a las notas de %s; se ignora.", path, folder)
+        return None
+
+    data_offset = -(-(header_start + header_length) // ARTIFACT_ALIGNMENT) * ARTIFACT_ALIGNMENT
+    data = np.frombuffer(buffer, dtype=np.int16, count=meta["frames"] * meta["channels"], offset=data_offset)
+    index = {name: tuple(entry) for name, entry in meta["notes"].items()}
+    return SampleBank(data.reshape(-1, meta["channels"]), index, meta["sample_rate"], meta["channels"],
+                      meta["fingerprint"])
+
+
+def load_shared_sample_bank(folder, store=None, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Mapea el banco de notas publicado en el almacén de recursos, generándolo si aún no existe.
+
+    El primer proceso decodifica y publica el artefacto; los demás esperan y mapean el mismo archivo,
+    así que el PCM ocupa memoria una sola vez sin importar cuántos procesos haya.
+    Devuelve None si no hay notas o si no se pudieron decodificar todas.
+    """
+    files = _list_note_files(folder)
+    if not files:
+        return None
+    store = store or get_asset_store()
+    name = f"samples-{_content_fingerprint(folder, files, sample_rate, channels)}"
+    try:
+        entry = store.get_or_publish(name, lambda path: build_sample_artifact(folder, path, sample_rate, channels),
+                                     extension=".bin")
+    except (RuntimeError, OSError) as e:
+        logger.warning("No se pudo publicar el banco de notas compartido: %s", e)
+        return None
+    with timed("load_artifact"):
+        return load_sample_artifact(store.path(entry))
+
+
+def get_sample_bank(folder, artifact_path=None):
+    """
+    Devuelve el banco compartido para la carpeta dada, cargándolo la primera vez.
+
+    Si se indica artifact_path y el archivo existe, se usa el banco precompilado en lugar de decodificar;
+    si no, el del almacén de recursos compartido entre procesos.
+    """
+    key = os.path.abspath(folder)
+    with _banks_lock:
+        bank = _banks.get(key)
+        if bank is None:
+            if artifact_path and os.path.isfile(artifact_path):
+                with timed("load_artifact"):
+                    bank = load_sample_artifact(artifact_path, folder)
+            if bank is None:
+                bank = load_shared_sample_bank(folder)
+            if bank is None:
+                bank = load_sample_bank(folder)
+            _banks[key] = bank
+        return bank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompila el banco de notas en un único archivo mapeable.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("folder", help="Carpeta con las notas MP3 (p. ej. resources/piano)")
+    parser.add_argument("--output", default=SAMPLE_ARTIFACT)
+    args = parser.parse_args()
+    path = build_sample_artifact(args.folder, args.output)
+    print(f"Banco de notas guardado en {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from controllers.config import STAR_CACHE_MEMORY_ENTRIES, DECODE_MAX_PIXELS, DECODE_MEMORY_BUDGET
+from controllers.asset_store import get_asset_store
+from controllers.detection import stars_to_coords
+from controllers.star_index import StarIndex
+from controllers.log import get_logger
+
+logger = get_logger("star_cache")
+
+# Se incrementa cuando cambia el formato o el algoritmo de detección, para invalidar el caché en disco
+CATALOG_VERSION = 4
+
+
+class StarCatalog:
+    """
+    Estrellas detectadas (arreglo STAR_DTYPE ordenado por x) junto con el tamaño de la imagen original.
+    """
+
+    def __init__(self, stars, width, height, image_hash=None):
+        self.stars = stars
+        self.width = width
+        self.height = height
+        self.image_hash = image_hash
+        self._index = None
+
+    def __len__(self):
+        return len(self.stars)
+
+    def to_coords(self):
+        """
+        Vista compatible con la API anterior: lista de diccionarios {'x', 'y'}.
+        """
+        return stars_to_coords(self.stars)
+
+    @property
+    def index(self):
+        """
+        Índice espacial de las estrellas; se construye en la primera consulta y vive con el catálogo en el LRU.
+        """
+        if self._index is None:
+            self._index = StarIndex(self.stars, self.width, self.height)
+        return self._index
+
+
+class StarCache:
+    """
+    Caché de catálogos de estrellas con dos niveles: LRU en memoria y arreglos .npy en el almacén de recursos.
+
+    La clave es el hash del contenido de la imagen más los parámetros de detección,
+    así que un acierto evita tanto decodificar la imagen como detectar las estrellas.
+    Los arreglos se mapean en solo lectura, así que todos los procesos comparten la misma copia.
+    """
+
+    def __init__(self, store=None, max_entries=STAR_CACHE_MEMORY_ENTRIES):
+        self.store = store or get_asset_store()
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image_hash, min_area):
+        # El presupuesto de decodificación decide si una imagen grande se reduce antes de detectar
+        return f"stars-{image_hash}-a{min_area}-p{DECODE_MAX_PIXELS}-m{DECODE_MEMORY_BUDGET >> 20}-v{CATALOG_VERSION}"
+
+    def _remember(self, key, catalog):
+        with self._lock:
+            self._memory[key] = catalog
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, image_hash, min_area):
+        """
+        Devuelve el StarCatalog guardado, o None si no existe.
+        """
+        key = self.key(image_hash, min_area)
+        with self._lock:
+            catalog = self._memory.get(key)
+            if catalog is not None:
+                self._memory.move_to_end(key)
+                return catalog
+
+        entry = self.store.lookup(key)
+        stars = self.store.open_array(key) if entry is not None else None
+        if stars is None:
+            return None
+        catalog = StarCatalog(stars, entry["meta"]["width"], entry["meta"]["height"], image_hash)
+        self._remember(key, catalog)
+        return catalog
+
+    def count(self, image_hash, min_area):
+        """
+        Número de estrellas guardadas sin cargar el arreglo, o None si no existe.
+        """
+        key = self.key(image_hash, min_area)
+        with self._lock:
+            catalog = self._memory.get(key)
+        if catalog is not None:
+            return len(catalog)
+        entry = self.store.lookup(key)
+        return entry["meta"]["count"] if entry is not None else None
+
+    def put(self, image_hash, min_area, catalog):
+        """
+        Publica un catálogo en el almacén y lo guarda en memoria ya mapeado desde allí.
+        """
+        key = self.key(image_hash, min_area)
+        meta = {"width": catalog.width, "height": catalog.height, "count": len(catalog)}
+
+        def write(path):
+            with open(path, "wb") as f:
+                np.save(f, catalog.stars)
+
+        try:
+            # Si otro proceso detectó la misma imagen a la vez, se conserva el catálogo que publicó primero
+            self.store.get_or_publish(key, write, meta, ".npy")
+            stars = self.store.open_array(key)
+            if stars is not None:
+                catalog.stars = stars  # Liberar la copia privada de este proceso
+        except OSError as e:
+            logger.error("No se pudo guardar el catálogo de estrellas: %s", e)
+        self._remember(key, catalog)
+        return catalog
@@ -0,0 +1,109 @@
+import struct
+import numpy as np
+
+from controllers.config import STAR_INDEX_CELL_STARS
+
+# Respuesta binaria: encabezado de 28 bytes seguido de columnas little-endian de count elementos cada una,
+# en este orden: x (int32), y (int32), area (int32), flux (float32), mag (float32). El encabezado
+# (magia, versión, reservado, total, offset, count, ancho, alto) deja las columnas alineadas a 4 bytes,
+# así que el cliente puede leerlas directamente con Int32Array / Float32Array.
+BINARY_MAGIC = b"PSTR"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHHIIIII")
+BINARY_COLUMNS = (('x', '<i4'), ('y', '<i4'), ('area', '<i4'), ('flux', '<f4'), ('mag', '<f4'))
+BINARY_MIMETYPE = "application/vnd.polaris.stars"
+
+
+def instrumental_magnitude(flux):
+    """
+    Magnitud instrumental -2.5 log10(flux): menor es más brillante; inf si el flujo no es positivo.
+    """
+    flux = np.asarray(flux, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(flux > 0, -2.5 * np.log10(flux), np.inf).astype(np.float32)
+
+
+class StarIndex:
+    """
+    Cuadrícula uniforme sobre las estrellas de un catálogo para consultar rectángulos sin recorrerlas todas.
+
+    Las estrellas se ordenan por celda (fila a fila) y offsets marca dónde empieza cada celda, así que las
+    celdas de una fila que cruzan el rectángulo son un único tramo contiguo. El tamaño de celda se elige
+    para tener en promedio STAR_INDEX_CELL_STARS estrellas por celda.
+    """
+
+    def __init__(self, stars, width, height, cell_size=None):
+        self.stars = stars
+        self.width = width
+        self.height = height
+        if cell_size is None:
+            cell_size = int(np.sqrt(width * height * STAR_INDEX_CELL_STARS / max(len(stars), 1)))
+        self.cell_size = max(1, cell_size)
+        self.columns = width // self.cell_size + 1
+        self.rows = height // self.cell_size + 1
+
+        cells = self._cell(stars['x'] // self.cell_size, stars['y'] // self.cell_size)
+        self.order = np.argsort(cells, kind="stable")  # Dentro de cada celda se conserva el orden por x
+        self.offsets = np.searchsorted(cells[self.order], np.arange(self.rows * self.columns + 1))
+        self.magnitude = instrumental_magnitude(stars['flux'])
+
+    def _cell(self, column, row):
+        column = np.clip(column, 0, self.columns - 1)
+        row = np.clip(row, 0, self.rows - 1)
+        return row.astype(np.int64) * self.columns + column
+
+    def query(self, x0=0, y0=0, x1=None, y1=None, min_area=None, max_area=None, min_mag=None, max_mag=None):
+        """
+        Índices (en el orden del catálogo, es decir por x) de las estrellas con x0 <= x < x1 y y0 <= y < y1
+        que cumplen los filtros de área y magnitud. Los límites son semiabiertos para que los mosaicos de
+        una vista no repitan estrellas en los bordes.
+        """
+        x1 = self.width if x1 is None else x1
+        y1 = self.height if y1 is None else y1
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width), min(y1, self.height)
+        if x0 >= x1 or y0 >= y1 or len(self.stars) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        first_column, last_column = x0 // self.cell_size, (x1 - 1) // self.cell_size
+        spans = []
+        for row in range(y0 // self.cell_size, (y1 - 1) // self.cell_size + 1):
+            start, end = self._cell(first_column, row), self._cell(last_column, row)
+            spans.append(self.order[self.offsets[start]:self.offsets[end + 1]])
+        candidates = np.concatenate(spans)
+
+        # Las celdas del borde pueden salirse del rectángulo: filtrar con las coordenadas exactas
+        x, y = self.stars['x'][candidates], self.stars['y'][candidates]
+        keep = (x >= x0) & (x < x1) & (y >= y0) & (y < y1)
+        if min_area is not None or max_area is not None:
+            area = self.stars['area'][candidates]
+            if min_area is not None:
+                keep &= area >= min_area
+            if max_area is not None:
+                keep &= area <= max_area
+        if min_mag is not None or max_mag is not None:
+            magnitude = self.magnitude[candidates]
+            if min_mag is not None:
+                keep &= magnitude >= min_mag
+            if max_mag is not None:
+                keep &= magnitude <= max_mag
+        return np.sort(candidates[keep])
+
+    def columns_for(self, indices):
+        """
+        Columnas de las estrellas indicadas, con la magnitud instrumental incluida.
+        """
+        stars = self.stars[indices]
+        return {'x': stars['x'], 'y': stars['y'], 'area': stars['area'], 'flux': stars['flux'],
+                'mag': self.magnitude[indices]}
+
+
+def encode_stars_binary(columns, total, offset, width, height):
+    """
+    Empaqueta una página de estrellas en el formato binario descrito en BINARY_HEADER / BINARY_COLUMNS.
+    """
+    count = len(columns['x'])
+    parts = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, total, offset, count, width, height)]
+    for name, dtype in BINARY_COLUMNS:
+        parts.append(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+    return b"".join(parts)
@@ -0,0 +1,113 @@
+import os
+import struct
+import threading
+
+from controllers.sample_bank import SAMPLE_WIDTH
+
+STREAM_READ_SIZE = 64 * 1024
+
+
+def wav_header(total_frames, sample_rate, channels, sample_width=SAMPLE_WIDTH):
+    """
+    Cabecera RIFF/WAVE PCM de 44 bytes para una pista de longitud conocida.
+    """
+    data_size = total_frames * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * channels * sample_width, channels * sample_width,
+        sample_width * 8,
+        b"data", data_size,
+    )
+
+
+class AudioStream:
+    """
+    Archivo WAV que se escribe por bloques mientras se renderiza.
+
+    Varios clientes pueden leerlo a la vez con iter_bytes: cada uno recibe lo ya escrito
+    y espera a los bloques siguientes hasta que el render termina.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.expected_size = None
+        self.started = False
+        self.closed = False
+        self._file = None
+        self._condition = threading.Condition()
+
+    def start(self, total_frames, sample_rate, channels):
+        header = wav_header(total_frames, sample_rate, channels)
+        self.expected_size = len(header) + total_frames * channels * SAMPLE_WIDTH
+        self._file = open(self.path, "wb")
+        self._append(header)
+        with self._condition:
+            self.started = True
+            self._condition.notify_all()
+
+    def write(self, pcm):
+        self._append(pcm.tobytes())
+
+    def _append(self, data):
+        self._file.write(data)
+        self._file.flush()
+        with self._condition:
+            self.size += len(data)
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Marca el stream como terminado (también si el render falló o se canceló).
+        """
+        if self._file is not None:
+            self._file.close()
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    @property
+    def complete(self):
+        """
+        El render terminó y el archivo contiene la pista completa.
+        """
+        return self.closed and self.size == self.expected_size
+
+    def wait_started(self):
+        """
+        Espera a que el render salga de la cola y escriba la cabecera; False si terminó sin empezar
+        (cancelado en la cola o fallido antes de mezclar).
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.started or self.closed)
+            return self.started
+
+    def iter_bytes(self, read_size=STREAM_READ_SIZE):
+        """
+        Genera los bytes del WAV en orden, esperando los que aún no se han escrito.
+
+        No hay tiempo límite: el trabajo siempre cierra el stream al terminar, al fallar o al cancelarse.
+        """
+        if not self.wait_started():
+            return
+
+        offset = 0
+        with open(self.path, "rb") as f:
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: self.size > offset or self.closed)
+                    available = self.size - offset
+                if available <= 0:
+                    return
+                while available > 0:
+                    data = f.read(min(read_size, available))
+                    offset += len(data)
+                    available -= len(data)
+                    yield data
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
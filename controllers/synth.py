@@ -0,0 +1,117 @@
+import hashlib
+import threading
+import numpy as np
+
+from controllers.sample_bank import SAMPLE_RATE, CHANNELS
+
+NOTE_COUNT = 88  # Mismas teclas que las notas de resources/piano ("1".."88" y "cut_1".."cut_88")
+HARMONICS = 10
+INHARMONICITY = 0.0004  # Los parciales de una cuerda real suben ligeramente por encima de k * f
+ATTACK_MS = 4
+CUT_DURATION_MS = 400
+SYNTH_VERSION = 1  # Subir al cambiar synthesize_note: invalida los audios del caché de resultados
+
+_synth_banks = {}
+_synth_banks_lock = threading.Lock()
+
+
+def note_frequency(number):
+    """
+    Frecuencia de la tecla number del piano (la 49 es el La de 440 Hz).
+    """
+    return 440.0 * 2 ** ((number - 49) / 12)
+
+
+def note_duration_ms(number):
+    """
+    Las notas graves duran más, como en un piano.
+    """
+    return int(np.clip(3200 - 30 * number, 900, 3200))
+
+
+def synthesize_note(frequency, frames, sample_rate=SAMPLE_RATE, harmonics=HARMONICS):
+    """
+    Sintetiza una nota por síntesis aditiva: parciales con amplitud 1/k y caída más rápida cuanto más agudos.
+
+    Devuelve un arreglo mono float32 de frames muestras con pico 1.0.
+    """
+    t = np.arange(frames, dtype=np.float32) / sample_rate
+
+    k = np.arange(1, harmonics + 1, dtype=np.float32)
+    partials = frequency * k * np.sqrt(1 + INHARMONICITY * k ** 2)
+    audible = partials < sample_rate / 2  # Sin aliasing: solo parciales por debajo de Nyquist
+    k, partials = k[audible], partials[audible]
+
+    # Todos los parciales a la vez: matriz (parciales, frames)
+    decay = (1.5 + 0.04 * frequency ** 0.5) * (1 + 0.35 * (k - 1))
+    tone = (np.sin(2 * np.pi * partials[:, None] * t) * (np.exp(-decay[:, None] * t) / k[:, None])).sum(axis=0)
+
+    attack = max(1, int(sample_rate * ATTACK_MS / 1000))
+    tone[:attack] *= np.linspace(0, 1, attack, dtype=np.float32)
+    release = min(frames, attack * 4)
+    tone[-release:] *= np.linspace(1, 0, release, dtype=np.float32)  # Sin chasquido al cortar
+    return tone / np.abs(tone).max()
+
+
+class SynthBank:
+    """
+    Instrumento sintetizado con la misma interfaz que SampleBank (nombres, índice de longitudes y get).
+
+    Cada nota se genera la primera vez que se pide y queda en memoria; no hay archivos ni decodificación.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS, amplitude=0.3):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.amplitude = amplitude
+        self.fingerprint = hashlib.sha1(
+            f"synth:{SYNTH_VERSION}:{sample_rate}:{channels}:{amplitude}:{HARMONICS}:{INHARMONICITY}:"
+            f"{ATTACK_MS}:{CUT_DURATION_MS}".encode()).hexdigest()[:16]
+        self.index = {}
+        for number in range(1, NOTE_COUNT + 1):
+            for name, duration in ((str(number), note_duration_ms(number)), (f"cut_{number}", CUT_DURATION_MS)):
+                self.index[name] = (0, int(sample_rate * duration / 1000))
+        self._notes = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index)
+
+    def get(self, name):
+        """
+        Devuelve el PCM (frames, canales) int16 de la nota, sintetizándola si aún no está en memoria.
+        """
+        pcm = self._notes.get(name)
+        if pcm is not None or name not in self.index:
+            return pcm
+        with self._lock:
+            pcm = self._notes.get(name)
+            if pcm is None:
+                number = int(name[4:] if name.startswith("cut_") else name)
+                tone = synthesize_note(note_frequency(number), self.index[name][1], self.sample_rate)
+                mono = (tone * self.amplitude * 32767).astype(np.int16)
+                pcm = np.repeat(mono[:, None], self.channels, axis=1)
+                pcm.setflags(write=False)
+                self._notes[name] = pcm
+            return pcm
+
+    def note(self, number, cut=False):
+        return self.get(f"cut_{number}" if cut else str(number))
+
+
+def get_synth_bank(sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Devuelve el sintetizador compartido para el formato dado (con su caché de notas ya generadas).
+    """
+    key = (sample_rate, channels)
+    with _synth_banks_lock:
+        bank = _synth_banks.get(key)
+        if bank is None:
+            bank = _synth_banks[key] = SynthBank(sample_rate, channels)
+        return bank
@@ -2,13 +2,19 @@ from tkinter import Tk, filedialog, Canvas, Label, Button, Frame, Entry, IntVar,
 from tkinter import ttk
 from PIL import Image, ImageTk
 import numpy as np
-from pydub import AudioSegment
 import os
-import cv2
 import webbrowser
 import threading
+import queue
 import sys
 
+# Permite importar el paquete controllers (banco de notas compartido con el servidor Flask)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from controllers.sample_bank import get_sample_bank
+from controllers.synth import get_synth_bank
+from controllers.mixer import plan_mix, mix_notes, to_audio_segment
+from controllers.detection import detect_stars_tiled, draw_stars, as_star_array, to_grayscale
+
 # Function to get the correct resource path, useful for bundling with PyInstaller
 def resource_path(relative_path):
     """ Get the absolute path to the resource, works for dev and for PyInstaller bundled app. """
@@ -32,7 +38,14 @@ PREDEFINED_IMAGES = [
     {"name": "Imagen 6", "path": resource_path(r"C:/POLARIS/photos/Imagen 6.jpg")},
 ]
 
-cancel_processing = False  # Indicador para cancelar el procesamiento
+MIN_STAR_AREA = 8  # Umbral mínimo de área (en píxeles) para retener una estrella
+PREVIEW_TILE_SIZE = 512  # Mosaicos pequeños para que la vista previa avance seguido
+POLL_INTERVAL_MS = 100  # Cada cuánto atiende la interfaz los mensajes de los hilos de trabajo
+
+# Los hilos de trabajo nunca tocan los widgets: envían (ejecución, tipo, datos) y Tk los atiende en poll_messages
+messages = queue.Queue()
+current_run = None  # Ejecución activa; al cancelar se descarta y sus mensajes se ignoran
+preview = {}  # Imagen mostrada: 'base' (sin estrellas), 'array' (con estrellas), 'scale' y 'dirty'
 
 # (rest of your code remains unchanged)
 
@@ -43,117 +56,145 @@ cancel_processing = False  # Indicador para cancelar el procesamiento
 
 def map_to_scale(value, old_min, old_max, new_min, new_max):
     if old_max == old_min:
-        return (new_min + new_max) / 2  # Valor por defecto en el medio del nuevo rango
-    return new_min + (value - old_min) * (new_max - new_min) / (old_max - old_min)
-
-def find_stars(image):
-    min_area = 3  # Umbral mínimo de área para retener una estrella
-
-    image_array = np.array(image.convert('RGB'))
-    gray_image = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-
-    _, thresholded = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    contours, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    star_coords_filtered = []
-    for contour in contours:
-        if cv2.contourArea(contour) >= min_area:
-            M = cv2.moments(contour)
-            if M['m00'] != 0:
-                cX = int(M['m10'] / M['m00'])
-                cY = int(M['m01'] / M['m00'])
-                star_coords_filtered.append((cY, cX))
-                
-                cv2.circle(image_array, (cX, cY), radius=2, color=(255, 0, 0), thickness=-1)
-
-    star_detection_progress['value'] = 100
-    return [{'x': int(x), 'y': int(y)} for y, x in star_coords_filtered], image_array
-
-def create_audio_from_coordinates(coords, image_width, output_filename, max_stars, interval_between_starts):
-    global cancel_processing
-    if not coords:
-        print("No se encontraron coordenadas.")
-        return
+        return np.zeros_like(value, dtype=float) + (new_min + new_max) / 2  # Valor por defecto en el medio del nuevo rango
+    return new_min + (np.asarray(value) - old_min) * (new_max - new_min) / (old_max - old_min)
 
-    coords.sort(key=lambda coord: coord['x'])
+class Run:
+    """ Un procesamiento (detección + audio) de una imagen, con su propia señal de cancelación. """
 
-    if max_stars is not None and len(coords) > max_stars:
-        coords = coords[:max_stars]
+    def __init__(self):
+        self.cancel_event = threading.Event()
 
-    y_values = [coord['y'] for coord in coords]
-    original_min_y = min(y_values)
-    original_max_y = max(y_values)
+    def cancelled(self):
+        return self.cancel_event.is_set()
 
-    total_duration = (len(coords) - 1) * interval_between_starts + 1000  # Extra 1000ms para seguridad
+    def post(self, kind, data=None):
+        messages.put((self, kind, data))
 
-    min_audio_duration = 10000  # 10 segundos en milisegundos
+def find_stars(image, run):
+    """ Detecta las estrellas a resolución completa; cada mosaico terminado se envía a la vista previa. """
+    gray_image = to_grayscale(image)
 
-    if total_duration < min_audio_duration:
-        total_duration = min_audio_duration
+    def on_tile(stars, done, total):
+        run.post("tile", (stars, done / total * 100))
 
-    base_audio = AudioSegment.silent(duration=total_duration)
+    return detect_stars_tiled(gray_image, MIN_STAR_AREA, tile_size=PREVIEW_TILE_SIZE, workers=1,
+                              on_tile=on_tile, should_cancel=run.cancelled)
 
-    current_time = 0
-    total_coords = len(coords)
-    processed_coords = 0
+def create_audio_from_coordinates(coords, output_filename, max_stars, interval_between_starts, run):
+    if len(coords) == 0:
+        print("No se encontraron coordenadas.")
+        return
 
-    for coord in coords:
-        if cancel_processing:
-            print("Procesamiento de audio cancelado.")
-            audio_processing_progress['value'] = 0
-            return
-        
-        processed_coords += 1
-        progress = (processed_coords / total_coords) * 100
-        audio_processing_progress['value'] = progress
-        root.update_idletasks()
+    stars = as_star_array(coords)  # Ordenadas por el eje X
 
-        x = coord['x']
-        y = coord['y']
+    if max_stars is not None and len(stars) > max_stars:
+        stars = stars[:max_stars]
 
-        try:
-            y_mapped = map_to_scale(y, original_min_y, original_max_y, 25, 75)
-            x_mapped = map_to_scale(x, 0, image_width, 0, total_duration)
-        except ValueError as e:
-            print(f"Error al mapear x={x} o y={y}: {e}")
-            continue
-
-        if 25 <= y_mapped <= 75:
-            file_name = os.path.join(AUDIO_FOLDER, f"{int(y_mapped)}.mp3")
-            
-            try:
-                sound = AudioSegment.from_mp3(file_name)
-                sound_duration = len(sound)  # Duración del archivo de sonido
-                end_time = current_time + sound_duration
-
-                if end_time > len(base_audio):
-                    extra_duration = end_time - len(base_audio)
-                    base_audio = base_audio + AudioSegment.silent(duration=extra_duration)
-
-                print(f"Superponiendo {file_name} en la posición {current_time / 1000} segundos.")
-                base_audio = base_audio.overlay(sound, position=int(current_time))
-                current_time += interval_between_starts  # Mover current_time al inicio de la siguiente nota
-            except FileNotFoundError:
-                print(f"Archivo {file_name} no encontrado.")
-    
-    if base_audio.duration_seconds > 0:
+    y_values = stars['y']
+    note_numbers = map_to_scale(y_values, y_values.min(), y_values.max(), 25, 75).astype(int)
+
+    bank = get_sample_bank(AUDIO_FOLDER)
+    if len(bank) == 0:
+        # Sin la carpeta de notas (p. ej. fuera de C:/POLARIS) se usa el sintetizador
+        bank = get_synth_bank()
+    plan = plan_mix(note_numbers, bank, interval_between_starts)
+
+    pcm = mix_notes(plan, bank, lambda progress: run.post("audio_progress", progress), run.cancelled)
+    if pcm is None or run.cancelled():
+        print("Procesamiento de audio cancelado.")
+        return
+
+    if len(pcm) > 0:
+        base_audio = to_audio_segment(pcm, bank.sample_rate, bank.channels)
         base_audio.export(output_filename, format="mp3")
         print(f"Audio guardado como: {output_filename}")
-        audio_saved_label.config(bg="green", text="¡Audio guardado exitosamente!")
-        open_audio_button.config(state="normal")
+        run.post("audio_saved", output_filename)
     else:
         print("No se generó audio.")
-    
-    audio_processing_progress['value'] = 100
+    run.post("audio_progress", 100)
+
+def process_in_background(file_path, output_filename, max_stars, interval_between_starts, run):
+    """ Hilo de trabajo: detección a resolución completa y después la mezcla, sin tocar la interfaz. """
+    try:
+        coords = find_stars(Image.open(file_path), run)
+        if coords is None:
+            return
+        run.post("stars", coords)
+        create_audio_from_coordinates(coords, output_filename, max_stars, interval_between_starts, run)
+    except Exception as e:
+        run.post("error", str(e))
+
+def show_preview(image, source_width):
+    """ Muestra la imagen ajustada al lienzo y prepara la copia sobre la que se dibujan las estrellas. """
+    preview['base'] = np.array(image.convert('RGB'))
+    preview['array'] = preview['base'].copy()
+    preview['scale'] = image.width / source_width
+    preview['dirty'] = True
+
+def draw_preview_stars(stars, reset=False):
+    if reset:
+        preview['array'] = preview['base'].copy()
+    if len(stars) == 0:
+        return
+    # Coordenadas de la imagen original a las de la imagen mostrada
+    scaled = np.empty(len(stars), dtype=stars.dtype)
+    height, width = preview['base'].shape[:2]
+    scaled['x'] = np.clip((stars['x'] * preview['scale']).astype(int), 0, width - 1)
+    scaled['y'] = np.clip((stars['y'] * preview['scale']).astype(int), 0, height - 1)
+    draw_stars(preview['array'], scaled)
+    preview['dirty'] = True
+
+def refresh_canvas():
+    tk_image = ImageTk.PhotoImage(Image.fromarray(preview['array']))
+    canvas.delete("all")
+    canvas.create_image(0, 0, anchor="nw", image=tk_image)
+    canvas.config(scrollregion=canvas.bbox("all"))
+    canvas.image = tk_image
+    preview['dirty'] = False
+
+def handle_message(kind, data):
+    if kind == "tile":
+        stars, progress = data
+        draw_preview_stars(stars)
+        star_detection_progress['value'] = progress
+    elif kind == "stars":
+        # El resultado final incluye las estrellas grandes que cruzan varios mosaicos
+        draw_preview_stars(data, reset=True)
+        star_detection_progress['value'] = 100
+    elif kind == "audio_progress":
+        audio_processing_progress['value'] = data
+    elif kind == "audio_saved":
+        audio_saved_label.config(bg="green", text="¡Audio guardado exitosamente!")
+        open_audio_button.config(state="normal")
+    elif kind == "error":
+        print(f"Error al procesar la imagen: {data}")
+        audio_saved_label.config(bg="red", text="Error al procesar")
+
+def poll_messages():
+    """ Atiende todos los mensajes pendientes y redibuja el lienzo como máximo una vez por intervalo. """
+    while True:
+        try:
+            run, kind, data = messages.get_nowait()
+        except queue.Empty:
+            break
+        if run is current_run:
+            handle_message(kind, data)
+    if preview.get('dirty'):
+        refresh_canvas()
+    root.after(POLL_INTERVAL_MS, poll_messages)
 
 def process_image(file_path=None):
+    global current_run
     if not file_path:
         file_path = filedialog.askopenfilename(filetypes=[("Archivos de imagen", "*.png;*.jpg;*.jpeg;*.bmp")])
     if file_path:
+        cancel_audio_processing()  # Una imagen nueva reemplaza al procesamiento anterior
         open_audio_button.config(state="disabled")
         audio_saved_label.config(bg="white", text="")
 
         image = Image.open(file_path)
+        source_width = image.width
         
         aspect_ratio = image.width / image.height
         canvas_width = canvas.winfo_width()
@@ -166,26 +207,10 @@ def process_image(file_path=None):
             new_height = canvas_height
             new_width = int(new_height * aspect_ratio)
         
-        image = image.resize((new_width, new_height))
-        image_width = image.size[0]
-        image_height = image.size[1]
-        
-        tk_image = ImageTk.PhotoImage(image)
-        canvas.config(scrollregion=canvas.bbox("all"))
-        canvas.create_image(0, 0, anchor="nw", image=tk_image)
-        canvas.image = tk_image
-
-        star_detection_progress['value'] = 0
-        audio_processing_progress['value'] = 0
-        root.update_idletasks()
-        
-        coords, image_array = find_stars(image)
-        
-        image_with_dots = Image.fromarray(image_array)
-        tk_image_with_dots = ImageTk.PhotoImage(image_with_dots)
-        
-        canvas.create_image(0, 0, anchor="nw", image=tk_image_with_dots)
-        canvas.image = tk_image_with_dots
+        # La imagen reducida solo se muestra; la detección usa la original en el hilo de trabajo
+        image.draft('RGB', (new_width, new_height))
+        show_preview(image.resize((new_width, new_height)), source_width)
+        refresh_canvas()
 
         global output_filename
         output_filename = DEFAULT_OUTPUT_FILENAME
@@ -203,9 +228,8 @@ def process_image(file_path=None):
             print("Valor de intervalo no válido. Usando el valor predeterminado de 350ms.")
             interval_between_starts = 350
         
-        global cancel_processing
-        cancel_processing = False
-        threading.Thread(target=create_audio_from_coordinates, args=(coords, image_width, output_filename, max_stars, interval_between_starts)).start()
+        current_run = Run()
+        threading.Thread(target=process_in_background, args=(file_path, output_filename, max_stars, interval_between_starts, current_run), daemon=True).start()
 
 def open_predefined_image(image_path):
     process_image(image_path)
@@ -217,8 +241,14 @@ def open_audio_file():
         print("El archivo de audio no existe.")
 
 def cancel_audio_processing():
-    global cancel_processing
-    cancel_processing = True
+    global current_run
+    if current_run is None:
+        return
+    # La interfaz se libera ya: el hilo de trabajo se detiene en su próxima comprobación y sus mensajes se ignoran
+    current_run.cancel_event.set()
+    current_run = None
+    star_detection_progress['value'] = 0
+    audio_processing_progress['value'] = 0
     print("Cancelando procesamiento de audio...")
     
 def open_flickr_album():
@@ -303,4 +333,8 @@ Label(predefined_frame, text="Imágenes Precargadas:").pack(side="left")
 for img in PREDEFINED_IMAGES:
     Button(predefined_frame, text=img['name'], command=lambda img_path=img['path']: open_predefined_image(img_path)).pack(side="left", padx=5)
 
+# Decodificar las notas una sola vez en segundo plano mientras se muestra la ventana
+threading.Thread(target=get_sample_bank, args=(AUDIO_FOLDER,), daemon=True).start()
+
+root.after(POLL_INTERVAL_MS, poll_messages)
 root.mainloop()
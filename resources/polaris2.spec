@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['polaris2.py'],
-    pathex=[],
+    pathex=['..'],
     binaries=[],
     datas=[('C:/POLARIS/piano', './piano'), ('C:/POLARIS/photos', './photos')],
     hiddenimports=[],